@@ -0,0 +1,113 @@
+"""Benchmark suite of the conversion engine.
+
+Every benchmark document is first checked against the frozen reference
+implementation (see `differential.py`), so that a speedup can only be
+reported for an engine that still produces the same LaTeX. Then the time
+of each conversion stage is measured. With `--compile`, the time pdflatex
+takes on the output is also measured, with the minimal preamble and with
+the full one (`--full-preamble ON`).
+
+    python scripts/benchmark.py --blocks 100 1000 --repeat 3 [--compile]
+"""
+
+# pylint: disable=W0621
+
+import argparse
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from time import perf_counter
+
+from mdtk import MarkdownParser
+
+sys.path.insert(0, str(Path(__file__).parent))
+from differential import ( # pylint: disable=C0413
+    _RandomSource, _block, check, compare, make_config
+)
+
+
+def make_document(blocks: int, seed: int = 0) -> str:
+    source = _RandomSource(random.Random(seed))
+    return "\n\n".join(_block(source) for _ in range(blocks)) + "\n"
+
+def time_stages(markdown: str, cfg, repeat: int = 3):
+    """Return the best time, over ``repeat`` runs, of every stage."""
+    timings = defaultdict(lambda: float("inf"))
+    for _ in range(repeat):
+        parser = MarkdownParser(markdown, cfg=cfg)
+        text = markdown
+        for stage in MarkdownParser.STAGES:
+            start = perf_counter()
+            text = getattr(parser, stage)(text)
+            timings[stage] = min(timings[stage], perf_counter() - start)
+    return dict(timings)
+
+def time_compile(markdown: str, cfg, repeat: int = 3):
+    """Return the best time, over ``repeat`` runs, pdflatex takes to
+    compile ``markdown`` converted with ``cfg``.
+    """
+    latex = MarkdownParser(markdown, cfg=cfg).latex
+    best = float("inf")
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "benchmark.tex"
+        path.write_text(latex, encoding="utf-8")
+        for _ in range(repeat):
+            start = perf_counter()
+            subprocess.run(
+                ["pdflatex", "-interaction=batchmode", "-draftmode", path.name],
+                cwd=directory, check=False, capture_output=True,
+            )
+            best = min(best, perf_counter() - start)
+    return best
+
+def report_compile(markdown: str, cfg, full_cfg, repeat: int):
+    minimal = time_compile(markdown, cfg, repeat)
+    full = time_compile(markdown, full_cfg, repeat)
+    print(
+        f"  pdflatex: {minimal:.3f} s with the minimal preamble, {full:.3f} s with "
+        f"the full one ({100 * (full - minimal) / full:.1f}% saved)"
+    )
+
+def run(block_counts, repeat: int, seed: int, examples: int, cfg, full_cfg=None):
+    mismatch = check(examples, seed, cfg=cfg)
+    if mismatch is not None:
+        print(mismatch)
+        return 1
+    for blocks in block_counts:
+        markdown = make_document(blocks, seed)
+        mismatch = compare(markdown, cfg)
+        if mismatch is not None:
+            print(mismatch)
+            return 1
+        timings = time_stages(markdown, cfg, repeat)
+        total = sum(timings.values())
+        size = len(markdown.encode("utf-8"))
+        print(f"\n{blocks} blocks, {size / 1024:.1f} KiB: {total:.3f} s ({size / 2**20 / total:.2f} MiB/s)")
+        for stage, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+            print(f"  {stage:<16} {seconds:8.4f} s  {100 * seconds / total:5.1f}%")
+        if full_cfg is not None:
+            report_compile(markdown, cfg, full_cfg, repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    arg_parser.add_argument("-b", "--blocks", type=int, nargs="+", default=[100, 1000])
+    arg_parser.add_argument("-r", "--repeat", type=int, default=3)
+    arg_parser.add_argument("-s", "--seed", type=int, default=0)
+    arg_parser.add_argument("-n", "--examples", type=int, default=100,
+                            help="random documents checked against the reference")
+    arg_parser.add_argument("-c", "--compile", action="store_true",
+                            help="also measure pdflatex with the minimal and full preambles")
+    args = arg_parser.parse_args()
+    full_cfg = None
+    if args.compile:
+        if shutil.which("pdflatex") is None:
+            print("pdflatex not found: compile times are not measured.")
+        else:
+            full_cfg = make_config(["--full-preamble", "ON"])
+    sys.exit(run(args.blocks, args.repeat, args.seed, args.examples, make_config(), full_cfg))
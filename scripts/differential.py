@@ -0,0 +1,266 @@
+"""Differential testing of the conversion engine against the frozen
+reference implementation in `reference_converter.py`.
+
+Random Markdown documents are generated (with Hypothesis if it is
+installed, with a seeded `random.Random` otherwise), converted by both
+engines, and compared stage by stage. The first mismatch is shrunk to a
+minimal failing document and reported with the stage where the outputs
+diverge.
+
+The stages the reference does not have are checked against golden
+outputs: each `golden/<stage>.md` must convert, with the default
+settings, into `golden/<stage>.tex`. `--update-golden` writes them again,
+to be reviewed before they are committed.
+
+    python scripts/differential.py --examples 500 --seed 0 [MDTK_OPTIONS]
+"""
+
+# pylint: disable=W0621
+
+import argparse
+import difflib
+import random
+import sys
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from mdtk import App, MarkdownParser
+
+GOLDEN_DIR = Path(__file__).parent / "golden"
+
+sys.path.insert(0, str(Path(__file__).parent))
+from reference_converter import ReferenceParser # pylint: disable=C0413
+
+try:
+    from hypothesis import given, seed as hypothesis_seed, settings, HealthCheck
+    from hypothesis import strategies as st
+except ImportError:
+    st = None
+
+_WORDS = (
+    "lorem", "ipsum", "LaTeX", "100%", "a_b", "C#", "$5", "R&D", "back\\slash",
+    "ff", "--", "---", "<>", "(x)", "[y]", "'quoted'", '"quoted"', "it's",
+    "*star*", "**bold**", "***both***", "_it_", "__bold__", "`code`",
+    "[link](http://example.com/a_b)", "[ref](#anchor)",
+)
+_CODE_LINES = ("x = 1", "y -- z", "a_b = '%s' % c", "# not a header", "> not a quote", "")
+_INFOS = ("", "python", "Preliminary annotation")
+_LIST_MARKERS = ("-", "*", "+", "1.")
+
+
+class _RandomSource:
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def choice(self, seq):
+        return self.rng.choice(seq)
+
+    def integer(self, low, high):
+        return self.rng.randint(low, high)
+
+
+class _HypothesisSource:
+    def __init__(self, data):
+        self.data = data
+
+    def choice(self, seq):
+        return self.data.draw(st.sampled_from(seq))
+
+    def integer(self, low, high):
+        return self.data.draw(st.integers(low, high))
+
+
+def _words(source, low=1, high=8):
+    return " ".join(source.choice(_WORDS) for _ in range(source.integer(low, high)))
+
+def _block(source):
+    kind = source.choice((
+        "paragraph", "paragraph", "header", "quote", "list", "code", "comment", "texenv",
+    ))
+    if kind == "header":
+        return "#" * source.integer(1, 6) + " " + _words(source, 1, 4)
+    if kind == "quote":
+        return "\n".join(
+            ">" * source.integer(1, 2) + " " + _words(source)
+            for _ in range(source.integer(1, 3))
+        )
+    if kind == "list":
+        marker = source.choice(_LIST_MARKERS)
+        return "\n".join(
+            f"{marker} {_words(source, 1, 4)}" for _ in range(source.integer(1, 4))
+        )
+    if kind == "code":
+        lines = [source.choice(_CODE_LINES) for _ in range(source.integer(1, 3))]
+        return f"```{source.choice(_INFOS)}\n" + "\n".join(lines) + "\n```"
+    if kind == "comment":
+        return f"[//]: # ({_words(source, 1, 3)})"
+    if kind == "texenv":
+        return (
+            "[//]: <> (%texenv begin center)\n"
+            + _words(source)
+            + "\n[//]: <> (%texenv end center)"
+        )
+    return _words(source, 1, 20)
+
+def generate_markdown(source) -> str:
+    blocks = [_block(source) for _ in range(source.integer(1, 12))]
+    return "\n\n".join(blocks) + "\n"
+
+
+@dataclass
+class Mismatch:
+    markdown: str
+    stage: str
+    expected: str
+    actual: str
+
+    def __str__(self):
+        diff = "\n".join(difflib.unified_diff(
+            self.expected.splitlines(), self.actual.splitlines(),
+            "reference", "engine", lineterm="",
+        ))
+        markdown = self.markdown if self.markdown.endswith("\n") else self.markdown + "\n"
+        return (
+            f"Outputs diverge at stage '{self.stage}' for the document:\n"
+            f"{'-' * 40}\n{markdown}{'-' * 40}\n{diff}"
+        )
+
+
+def make_config(args=()):
+    with tempfile.NamedTemporaryFile(suffix=".md") as f:
+        return App([f.name, *args]).resolved
+
+class _Failure(str):
+    """Output of a stage that raised: the name of the exception."""
+
+def _run(parser, stage, text):
+    try:
+        return getattr(parser, stage)(text)
+    except Exception as exc: # pylint: disable=W0718
+        return _Failure(f"<{type(exc).__name__}>")
+
+def compare(markdown: str, cfg) -> Mismatch | None:
+    """Convert ``markdown`` with both engines, stage by stage, and return
+    the first mismatch, or None if every stage agrees. Stages added to the
+    engine after the reference was frozen are applied to both outputs (see
+    `check_golden` for their own check). A document the reference fails to
+    convert has no expected output from that stage on.
+    """
+    reference = ReferenceParser(markdown, cfg)
+    engine = MarkdownParser(markdown, cfg=cfg)
+    expected = actual = markdown
+    for stage in MarkdownParser.STAGES:
+        if not hasattr(reference, stage):
+            expected = actual = _run(engine, stage, actual)
+            continue
+        expected = _run(reference, stage, expected)
+        if isinstance(expected, _Failure):
+            return None
+        actual = _run(engine, stage, actual)
+        if expected != actual:
+            return Mismatch(markdown, stage, expected, actual)
+    return None
+
+def _shrink(markdown: str, cfg) -> Mismatch:
+    """Greedily remove blocks, then lines, then characters while the
+    document still fails.
+    """
+    mismatch = compare(markdown, cfg)
+    for sep in ("\n\n", "\n", ""):
+        parts = markdown.split(sep) if sep else list(markdown)
+        i = 0
+        while i < len(parts):
+            candidate = sep.join(parts[:i] + parts[i + 1:])
+            candidate_mismatch = compare(candidate, cfg)
+            if candidate_mismatch is not None:
+                parts, mismatch = parts[:i] + parts[i + 1:], candidate_mismatch
+            else:
+                i += 1
+        markdown = sep.join(parts)
+    return mismatch
+
+def check_random(examples: int, seed: int, cfg) -> Mismatch | None:
+    rng = random.Random(seed)
+    for _ in range(examples):
+        markdown = generate_markdown(_RandomSource(rng))
+        if compare(markdown, cfg) is not None:
+            return _shrink(markdown, cfg)
+    return None
+
+def check_hypothesis(examples: int, seed: int, cfg) -> Mismatch | None:
+    found = []
+
+    @hypothesis_seed(seed)
+    @settings(
+        max_examples=examples, deadline=None, database=None,
+        suppress_health_check=list(HealthCheck),
+    )
+    @given(st.data())
+    def _check(data):
+        mismatch = compare(generate_markdown(_HypothesisSource(data)), cfg)
+        if mismatch is not None:
+            found[:] = [mismatch]
+            raise AssertionError(str(mismatch))
+
+    try:
+        _check() # pylint: disable=E1120
+    except AssertionError:
+        # Hypothesis replays the shrunk example last
+        return _shrink(found[-1].markdown, cfg)
+    return None
+
+def check_golden(update: bool = False) -> list[Mismatch]:
+    """Convert every golden document with the default settings and return
+    the mismatches with their golden output. With ``update``, write the
+    outputs as the golden ones instead.
+    """
+    cfg = make_config()
+    mismatches = []
+    for path in sorted(GOLDEN_DIR.glob("*.md")):
+        markdown = path.read_text(encoding="utf-8")
+        actual = MarkdownParser(markdown, cfg=cfg).parse_body()
+        golden = path.with_suffix(".tex")
+        if update:
+            golden.write_text(actual, encoding="utf-8")
+        elif not golden.exists() or golden.read_text(encoding="utf-8") != actual:
+            expected = golden.read_text(encoding="utf-8") if golden.exists() else ""
+            mismatches.append(Mismatch(markdown, f"golden/{path.stem}", expected, actual))
+    return mismatches
+
+def check(examples: int = 200, seed: int = 0, cfg=None, use_hypothesis: bool = True):
+    """Compare the engines on ``examples`` random documents and return the
+    minimal mismatch found, if any.
+    """
+    if cfg is None:
+        cfg = make_config()
+    if use_hypothesis and st is not None:
+        return check_hypothesis(examples, seed, cfg)
+    return check_random(examples, seed, cfg)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    arg_parser.add_argument("-n", "--examples", type=int, default=200)
+    arg_parser.add_argument("-s", "--seed", type=int, default=0)
+    arg_parser.add_argument("--no-hypothesis", action="store_true")
+    arg_parser.add_argument("--update-golden", action="store_true")
+    # Any other option is passed to mdtk, e.g. --pkg-fancyvrb OFF
+    args, mdtk_args = arg_parser.parse_known_args()
+    if args.update_golden:
+        check_golden(update=True)
+        sys.exit(0)
+    mismatches = check_golden()
+    for mismatch in mismatches:
+        print(mismatch)
+    if mismatches:
+        sys.exit(1)
+    mismatch = check(
+        args.examples, args.seed,
+        cfg=make_config(mdtk_args),
+        use_hypothesis=not args.no_hypothesis,
+    )
+    if mismatch is not None:
+        print(mismatch)
+        sys.exit(1)
+    print(f"No mismatch in {args.examples} documents.")
@@ -0,0 +1,92 @@
+"""Check that the memory a conversion needs stays proportional to its input.
+
+A large report-like document (headers, paragraphs, lists, tables, code,
+quotations and links) is generated, then read, converted and written as
+`mdtk` does, with a `MemoryProfiler` limited to `--factor` times the size
+of the input. The check fails if a stage goes above the limit.
+
+    python scripts/memory_check.py --size 200 --factor 6 [MDTK_OPTIONS]
+"""
+
+# pylint: disable=W0621
+
+import argparse
+import sys
+import tempfile
+from pathlib import Path
+
+from mdtk import App, MarkdownParser
+from mdtk._exceptions import MemoryLimitError
+from mdtk.files import read_markdown
+from mdtk.profiling import MemoryProfiler
+
+_SECTION = """## Section {i}
+
+Some *emphasized* and **bold** text with `inline code`, a [link](http://example.com/{i})
+and "quotes" in paragraph {i}, with 50% of R&D's budget.
+
+A second paragraph, with a \\LaTeX{{}} mention and a [reference](#section-{j}).
+
+> A quotation, in section {i}.
+
+- first item {i}
+- second item
+
+| a | b |
+|---|---|
+| {i} | x_{i} |
+
+```python
+x = {i}
+```
+
+"""
+
+
+def write_document(path: Path, size: int):
+    """Write a document of about ``size`` bytes to ``path``."""
+    written = i = 0
+    with open(path, "w", encoding="utf-8") as f:
+        while written < size:
+            section = _SECTION.format(i=i, j=max(i - 1, 0))
+            f.write(section)
+            written += len(section)
+            i += 1
+
+def check(path: Path, factor: float, args=()):
+    """Convert ``path`` with a memory limit of ``factor`` times its size and
+    return the peak of every stage. ``MemoryLimitError`` is raised if a
+    stage goes above the limit.
+    """
+    output = path.with_suffix(".tex")
+    app = App([str(path), "-o", str(output), *args])
+    max_memory = int(factor * path.stat().st_size)
+    with MemoryProfiler(max_memory=max_memory) as profiler:
+        with profiler.stage("read"):
+            markdown = read_markdown(app.input)
+            md_parser = MarkdownParser(markdown, cfg=app, profiler=profiler)
+            del markdown
+        with profiler.stage("parse"):
+            md_parser.document # pylint: disable=W0104
+        with profiler.stage("render"):
+            with open(output, "w", encoding="utf-8") as f:
+                md_parser.write_to(f)
+    return profiler
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    arg_parser.add_argument("--size", type=float, default=200, metavar="MiB")
+    arg_parser.add_argument("--factor", type=float, default=6)
+    # Any other option is passed to mdtk, e.g. --split
+    args, mdtk_args = arg_parser.parse_known_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "document.md"
+        write_document(path, int(args.size * 2**20))
+        try:
+            profiler = check(path, args.factor, mdtk_args)
+        except MemoryLimitError as exc:
+            print(exc)
+            sys.exit(1)
+        print(profiler.report(input_size=path.stat().st_size))
+    print(f"Peak under {args.factor:g} times the input.")
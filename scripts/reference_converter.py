@@ -0,0 +1,468 @@
+"""Frozen reference implementation of the Markdown to LaTeX conversion.
+
+This is a copy of the `MarkdownParser` stages of the baseline (`mdtk/convert.py`
+as it was before the conversion engine was optimized), along with the
+regular expressions and the `LatexEnvironment` they used. It must not be
+changed when `mdtk.convert` is: it is the baseline that `differential.py`
+compares the optimized engine against. Stages added since have no
+reference here, and are checked against golden outputs instead.
+
+The only changes to the copied code are marked with "Frozen copy:". The
+settings are a `ResolvedConfig`, which is immutable; the document
+preamble and the whole-document `parse` are left out, as they are not
+conversion stages; and text that was passed to `re.sub` as a pattern or
+a replacement template, while it is literal text, is replaced as such.
+In-document commands are run by `mdtk.commands`.
+"""
+
+# pylint: disable=E0203,E1101,W0621,C0103
+
+import re
+from functools import partial
+from re import finditer, sub
+from textwrap import indent as indent_
+from types import SimpleNamespace
+from typing import Optional, Sequence, Mapping, Any
+from uuid import uuid4
+from warnings import warn
+
+from mdtk._exceptions import CommandError
+from mdtk.commands import execute
+
+
+# Frozen copy: mdtk/_expressions.py
+def _expressions():
+    from re import compile, DOTALL, MULTILINE # pylint: disable=W0622,C0415
+
+    headers = {
+        1: compile(r"^#{1}\s*(.+)\s*$", MULTILINE),
+        2: compile(r"^#{2}\s*(.+)\s*$", MULTILINE),
+        3: compile(r"^#{3}\s*(.+)\s*$", MULTILINE),
+        4: compile(r"^#{4}\s*(.+)\s*$", MULTILINE),
+        5: compile(r"^#{5}\s*(.+)\s*$", MULTILINE),
+        6: compile(r"^#{6}\s*(.+)\s*$", MULTILINE),
+    }
+    headerany = compile(r"^#+\s*(.+)\s*$", MULTILINE)
+
+    inline_code = compile(r"(?<![`\\])`([^`]+?)(?<!\\)`(?!`)")
+    block_code = compile(r"^```(.*?)\n(.*?)\n```$", MULTILINE+DOTALL)
+    block_quotes = compile(r"\n((^>+.*\n)+)", MULTILINE)
+
+    href = compile(r"\[(.+?)\]\((.+?)\)")
+
+    environment = compile(
+        r"\[//\]:\s(?:<>|#)\s\(%texenv begin (.*)\)(.+?)\[//\]:\s(?:<>|#)\s\(%texenv end \1\)",
+        DOTALL+MULTILINE
+    )
+
+    list_dash = compile(r"\n(^\s{0,3}\-\s+.*$\n)+\n", MULTILINE)
+    list_ast = compile(r"\n^(\s{0,3}\*\s+.*?\n)+\n", MULTILINE)
+    list_plus = compile(r"\n^(\s{0,3}\+\s+.*?\n)+\n", MULTILINE)
+    list_num = compile(r"\n^(\s{0,3}\d+\.+\s.*?\n)+\n", MULTILINE)
+
+    emph_3ast = compile(r"(?<!\*)\*{3}(\w[^\*\n]*?\w)\*{3}(?!\*)",)
+    emph_3usc = compile(r"(?<!_)_{3}(\w[^\_\n]*?\w)_{3}(?!_)")
+    emph_2ast = compile(r"(?<!\*)\*{2}(\w[^\*\n]*?\w)\*{2}(?!\*)",)
+    emph_2usc = compile(r"(?<!_)_{2}(\w[^\_\n]*?\w)_{2}(?!_)",)
+    emph_1ast = compile(r"(?<!\*)\*{1}(\w[^\*\n]*?\w)\*{1}(?!\*)",)
+    emph_1usc = compile(r"(?<!_)_{1}(\w[^\*\n]*?\w)_{1}(?!_)",)
+
+    comment = compile(r"\[//\]:\s+(?:<>|#)\s+\((.*)\)")
+    comment_cmd = compile(r"%\s*(\w*)\s*(.*)")
+
+    single_quotations = compile(r"(?<![\w'])'{1}([^']+?)'{1}(?![\w'])")
+    double_quotations = compile(r'(?<![\w"])"{1}([^"]+?)"{1}(?![\w"])')
+    return SimpleNamespace(**locals())
+
+xpr = _expressions()
+
+
+# Frozen copy: LatexEnvironment, from mdtk/environment.py
+class LatexEnvironment:
+    def __init__(self,
+                 name: str,
+                 args: Optional[list[str]] = None,
+                 content: Optional[str] = "",
+                 indent=True,
+                 curly=False,
+                 newline=True,
+                 indent_content=None,
+                 indent_arguments=None,
+    ):
+        self.name = name
+        if args is None:
+            args = []
+        if isinstance(args, str):
+            args = [args]
+        self.args = args
+        self.content = content
+        self.indent = self._get_indent(indent, indent_arguments, indent_content)
+        self.curly = curly
+        self.newline = newline
+        self.parse()
+    
+    @staticmethod
+    def _get_indent(default, *args):
+        return tuple((arg if arg is not None else default) for arg in args)
+
+
+    def __str__(self):
+        sep = ",\n" if self.newline else ","
+        if self.indent[0]:
+            sep += " " * (9 + len(self.name))
+        args_str = sep.join(list(filter(bool, self.args)))
+        if args_str:
+            args_str = f"[{args_str}]"
+        line_begin = f"\\begin{{{self.name}}}{args_str}"
+        line_end = f"\\end{{{self.name}}}"
+        content = self.content
+        if self.indent[1]:
+            content = indent_(content, " "*4)
+        return f"{line_begin}\n{content}\n{line_end}\n"
+    
+    def add_argument(self, argument):
+        if isinstance(argument, list):
+            self.args.extend(argument)
+        else:
+            self.args.append(argument)
+    
+    def parse(self):
+        content = self.content
+        pattern_texenvarg = r"\[//\]:\s(?:<>|#)\s\(%texenvarg (.*)\)\n"
+        for match_ in finditer(pattern_texenvarg, content):
+            self.add_argument(match_.groups()[0].split())
+        content = sub(pattern_texenvarg, "", content)
+        self.content = content.strip()
+
+
+# Frozen copy: mdtk/convert.py
+_REGEX_ESCAPE_CHARACTERS = "\\$^.+*"
+
+class ReferenceParser:
+
+    def __init__(self, markdown, cfg):
+        self.markdown = markdown
+        self._latex = None
+        # Frozen copy: a ResolvedConfig is always passed
+        self.cfg = cfg
+    
+    @property
+    def code_environment_factory(self):
+        cfg = self.cfg
+        return partial(
+            LatexEnvironment, name=cfg.env["verbatim"],
+            args=cfg.env_args.get("verbatim"), indent_content=False
+        )
+    
+    @property
+    def quote_environment_factory(self):
+        cfg = self.cfg
+        return partial(
+            LatexEnvironment, name=cfg.env["quote"],
+            args=cfg.env_args.get("quote"), indent_content=True
+        )
+
+    @property
+    def escape_characters(self):
+        chrlst = list(self.cfg.escape_characters)
+        if self.cfg.latex_symb:
+            chrlst += ["LaTeX"]
+        if "\\" in chrlst:
+            chrlst.remove("\\")
+            chrlst = ["\\"] + chrlst
+        return chrlst
+
+    def sections(self, text):
+        cfg = self.cfg
+        for i in range(6, 1, -1):
+            search = xpr.headers[i]
+            replace = rf"\\{cfg.headers[i]}{{\1}}"
+            text = re.sub(search, replace, text)
+        if cfg.headers[1] != "title":
+            text = re.sub(xpr.headers[1], rf"\\{cfg.headers[1]}{{\1}}", text)
+        else:
+            title_match = re.search(xpr.headers[1], text)
+            if title_match is not None:
+                # Frozen copy: the settings are immutable
+                self.cfg = cfg.replace(title=title_match.groups()[0])
+            text = re.sub(xpr.headers[1], "", text)
+        return text
+    
+    @staticmethod
+    def inline_code(text):
+        """Inline literal code"""
+        text = re.sub(xpr.inline_code, r"\\texttt{\1}", text)
+        return text
+
+    def block_code(self, text):
+        """Block literal code"""
+        def _convert_arg(arg):
+            if arg == "":
+                return arg
+            if cfg.pkg["fancyvrb"]:
+                return f"label={arg}"
+            return ""
+
+        cfg = self.cfg
+        TexEnv = self.code_environment_factory # pylint: disable=C0103
+        
+        while True:
+            match_ = re.search(xpr.block_code, text)
+            if match_ is None:
+                break
+            arg, content = match_.groups()
+            start, end = match_.span()
+            texenv = TexEnv(content=content)
+            if arg:
+                texenv.args.append(_convert_arg(arg))
+            text = text[:start] + str(texenv) + text[end:]
+        return text
+
+    def block_quotes(self, text):
+        """Block quotes"""
+        TexEnv = self.quote_environment_factory # pylint: disable=C0103
+
+        while True:
+            match_ = re.search(xpr.block_quotes, text)
+            if match_ is None:
+                break
+            content, _ = match_.groups()
+            content = "\n".join([line.strip("> ") for line in content.split("\n")])
+            start, end = match_.span()
+            texenv = TexEnv(content=content)
+            text = text[:start] + str(texenv) + text[end:]
+        return text
+        
+    def environments(self, text):
+        while True:
+            match_ = re.search(xpr.environment, text)
+            if match_ is None:
+                break
+            name, content = match_.groups()
+            start, end = match_.span()
+            texenv = LatexEnvironment(name=name, content=content)
+            text = text[:start] + str(texenv) + text[end:]
+        return text
+
+    @classmethod
+    def _get_shielded_positions_href(cls, text):
+        shielded_positions = []
+        for match_ in re.finditer(xpr.href, text):
+            start, _ = match_.span()
+            group = match_.group()
+
+            span_link = (
+                start + group.index("(") + 1,
+                start + group.index(")")
+            )
+
+            shielded_positions.append(span_link)
+
+        return shielded_positions
+
+    @classmethod
+    def _get_shielded_positions(cls, text):
+        shielded_positions = []
+        shield_patterns = (
+            xpr.comment,
+            xpr.block_code,
+            xpr.headerany,
+        )
+        for pattern in shield_patterns:
+            for match_ in re.finditer(pattern, text):
+                shielded_positions.append(match_.span())
+        # Extend with positions coming from hrefs
+        shielded_positions.extend(
+            cls._get_shielded_positions_href(text)
+        )
+        return _filter_and_validate_positions(shielded_positions)
+    
+    @classmethod
+    def _shield(cls, text):
+        positions = cls._get_shielded_positions(text)
+        masked_text = ""
+        placeholders = {}
+        end_p = 0
+        for start, end in positions:
+            placeholder = f"<{uuid4()}>"
+            shielded_text = text[start:end]
+            placeholders[placeholder] = shielded_text
+            masked_text += text[end_p:start] + placeholder
+            end_p = end
+        masked_text += text[end_p:]
+        return masked_text, placeholders
+    
+    @classmethod
+    def _unshield(cls, text, placeholders):
+        for placeholder, shielded_text in placeholders.items():
+            # Frozen copy: the shielded text was a replacement template
+            text = text.replace(placeholder, shielded_text)
+        return text
+
+    @staticmethod
+    def href(text):
+        return re.sub(xpr.href, r"\\href{\2}{\1}", text)
+    
+    @staticmethod
+    def enumerate(text):
+        envs_patterns = [
+            ("itemize", xpr.list_dash, lambda x: x.lstrip(" -")),
+            ("itemize", xpr.list_ast, lambda x: x.lstrip(" *")),
+            ("itemize", xpr.list_plus, lambda x: x.lstrip(" +")),
+            ("enumerate", xpr.list_num, lambda x: x.split(".", 1)[1])
+        ]
+        for env, pattern, strip_fun in envs_patterns:
+            while True:
+                match_ = re.search(pattern, text)
+                if match_ is None:
+                    break
+                start, end = match_.span()
+                group = match_.group().strip(" \n")
+                content = "\n".join([
+                    "\\item " + strip_fun(item).strip(" \n")
+                    for item in group.split("\n")
+                ])
+                texenv = LatexEnvironment(name=env, content=content)
+                text = text[:start] + f"\n\n{str(texenv)}\n\n" + text[end:]
+        return text
+    
+    def emph(self, text):
+        cmd_double = self.cfg.cmd["double"]
+        cmd_single = self.cfg.cmd["single"]
+        text = re.sub(xpr.emph_3ast, rf"\\{cmd_double}{{\\{cmd_single}{{\1}}}}", text)
+        text = re.sub(xpr.emph_3usc, rf"\\{cmd_double}{{\\{cmd_single}{{\1}}}}", text)
+        text = re.sub(xpr.emph_2ast, rf"\\{cmd_double}{{\1}}", text)
+        text = re.sub(xpr.emph_2usc, rf"\\{cmd_double}{{\1}}", text)
+        text = re.sub(xpr.emph_1ast, rf"\\{cmd_single}{{\1}}", text)
+        text = re.sub(xpr.emph_1usc, rf"\\{cmd_single}{{\1}}", text)
+        return text
+
+    @staticmethod
+    def _escape(text: str, escape_characters: Sequence[str]):
+        escape_positions = set()
+        # Populate escape_positins (for all escape characteres)
+        for ch in escape_characters:
+            # List of spans of verbatims and comments in text
+            for match_ in re.finditer(_regex_escape(ch), text):
+                pos = match_.start()
+                escape_positions.add(pos)
+        # Add escape characters where necessary
+        # sorted and reversed so that already added escape characters don't mess
+        # with the numbering of the rest
+        text = list(text)
+        for pos in sorted(escape_positions, reverse=True):
+            text.insert(pos, "\\")
+        return "".join(text)
+
+    @classmethod
+    def _escape_placeholders(cls, placeholders: Mapping[Any, str], escape_characters: Sequence[str]):
+        for placeholder, value in placeholders.items():
+            # Escape characters in titles
+            match_ = re.match(xpr.headerany, value)
+            if match_ is not None:
+                title = match_.groups()[0]
+                title_e = cls._escape(title, escape_characters=escape_characters)
+                # Frozen copy: the title was a pattern
+                placeholders[placeholder] = value.replace(title, title_e)
+                continue
+            # Escape characters in hrefs
+            match_ = re.match(xpr.href, value)
+            if match_ is not None:
+                name, a = match_.groups()
+                name_e = cls._escape(name, escape_characters=escape_characters)
+                a_e = cls._escape(a, escape_characters=set(escape_characters).intersection(["\\"]))
+                # Frozen copy: the name and the target were patterns
+                placeholders[placeholder] = value.replace(a, a_e).replace(name, name_e)
+                continue
+        return placeholders
+    
+    def escape(self, text):
+        """Escape characters"""
+        # Positions in text to be escaped
+        escape_characters = self.escape_characters
+        text, placeholders = ReferenceParser._shield(text)
+        text = self._escape(text, escape_characters=escape_characters)
+        placeholders = self._escape_placeholders(placeholders, escape_characters=escape_characters)
+        text = self._unshield(text, placeholders)
+
+        # FIX: ensure proper spacing after \LaTeX
+        text = re.sub(r"\\LaTeX(?!\{)", r"\\LaTeX{}", text) 
+        return text
+
+    def break_ligatures(self, text):
+        def _break(l, t):
+            while l in t:
+                t = re.sub(l, f"{l[0]}{{}}{l[1]}", t)
+            return t
+        cfg = self.cfg
+        for lig in cfg.break_ligatures:
+            text = _break(_regex_escape(lig), text)
+        return text
+    
+    @staticmethod
+    def _to_comment(text):
+        return f"% {text}"
+
+    def comments(self, text):
+        commands = set()
+        for comment in re.finditer(xpr.comment, text):
+            content = comment.groups()[0]
+            position = comment.start()
+            if content[0] == "%":
+                match_ = re.match(xpr.comment_cmd, content)
+                if match_ is None:
+                    raise CommandError(content)
+                command, arg = match_.groups()
+                args = arg.split()
+                commands.add(command)
+                try:
+                    new_text, cfg = execute(command=command, args=args, text=text, position=position)
+                except NotImplementedError:
+                    warn(f"Not implemented: '{command}'.")
+                # Frozen copy: the pattern of every comment was substituted
+                text = text.replace(comment.group(), new_text, 1)
+                # Frozen copy: the settings are immutable
+                if cfg:
+                    self.cfg = self.cfg.replace(**cfg)
+            else:
+                # Frozen copy: the pattern of every comment was substituted
+                text = text.replace(comment.group(), self._to_comment(content), 1)
+        return text
+    
+    def quotation_marks(self, text):
+        # pylint: disable=W0101
+        quotations_patterns = [
+            (("``", "''"), xpr.double_quotations),
+            (("`", "'"), xpr.single_quotations),
+        ]
+        text, key = self._shield(text)
+        for quotations, pattern in quotations_patterns:
+            while True:
+                match_ = re.search(pattern, text)
+                if match_ is None:
+                    break
+                start, end = match_.span()
+                content = match_.groups()[0]
+                quotation_text = quotations[0] + content + quotations[1]
+                text = text[:start] + quotation_text + text[end:]
+        return self._unshield(text, key)
+
+def _regex_escape(s):
+    if len(s) > 1:
+        return "".join([_regex_escape(c) for c in s])
+    if s in _REGEX_ESCAPE_CHARACTERS:
+        return "\\" + s
+    return s
+
+def _filter_and_validate_positions(positions: Sequence[tuple[int, int]]):
+    filtered_positions = []
+    for start1, end1 in sorted(positions):
+        if any(start2 <= start1 <= end1 <= end2 for (start2, end2) in filtered_positions):
+            continue
+        if any(start2 <= start1 <= end2 <= end1 for (start2, end2) in filtered_positions):
+            raise ValueError(
+                "One position range partially contains another: "
+                "(start1 < start2 < end1 < end2)"
+            )
+        filtered_positions.append((start1, end1))
+    return filtered_positions
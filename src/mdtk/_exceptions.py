@@ -14,4 +14,13 @@ class NoFontFilesError(FileNotFoundError):
         super().__init__(message)
 
 class ValidationError(RuntimeError):
-    pass
\ No newline at end of file
+    pass
+
+
+class MemoryLimitError(MemoryError):
+    def __init__(self, stage, peak, limit):
+        message = (
+            f"Stage '{stage}' peaked at {peak / 2**20:.1f} MiB, "
+            f"above the limit of {limit / 2**20:.1f} MiB."
+        )
+        super().__init__(message)
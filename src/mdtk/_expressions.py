@@ -1,4 +1,38 @@
-from re import compile, DOTALL, MULTILINE # pylint: disable=W0622
+"""Bundle of every regular expression used at conversion time.
+
+All patterns are compiled once, at import, with the backend selected by
+``regex_backend`` in ``config.yaml``: ``re`` (default), ``regex``, or
+``auto`` (``regex`` if installed, ``re`` otherwise). Callers must use the
+methods of the compiled patterns (``pattern.sub(...)``) rather than the
+module-level functions of ``re``, so that the backend can be swapped.
+"""
+# pylint: disable=W0622
+from functools import lru_cache
+from importlib import import_module
+from warnings import warn
+
+from mdtk.config import config
+
+_BACKENDS = ("re", "regex", "auto")
+
+def _load_backend(name):
+    if name not in _BACKENDS:
+        raise ValueError(
+            f"Unknown regex backend '{name}'. Choose among: {', '.join(_BACKENDS)}."
+        )
+    if name != "re":
+        try:
+            return import_module("regex")
+        except ImportError:
+            if name == "regex":
+                warn("Regex backend 'regex' is not installed. Falling back to 're'.")
+    return import_module("re")
+
+backend = _load_backend(config.regex_backend)
+compile = backend.compile
+escape = backend.escape
+DOTALL = backend.DOTALL
+MULTILINE = backend.MULTILINE
 
 headers = {
     1: compile(r"^#{1}\s*(.+)\s*$", MULTILINE),
@@ -15,11 +49,24 @@ block_code = compile(r"^```(.*?)\n(.*?)\n```$", MULTILINE+DOTALL)
 block_quotes = compile(r"\n((^>+.*\n)+)", MULTILINE)
 
 href = compile(r"\[(.+?)\]\((.+?)\)")
+href_target = compile(r"\\href\{([^}]*)\}")
+label = compile(r"\\label\{([^}]*)\}")
+image = compile(r"!\[(.*?)\]\((.+?)\)")
+image_block = compile(r"^!\[(.*?)\]\((.+?)\)[ \t]*$", MULTILINE)
+
+table_delimiter = compile(
+    r"^[ \t]*\|?(?:[ \t]*:?-+:?[ \t]*\|)+(?:[ \t]*:?-+:?[ \t]*)?$", MULTILINE
+)
+table_cell_separator = compile(r"(?<!\\)\|")
+# A pipe inside a cell, once its backslash is itself escaped
+table_escaped_pipe = compile(r"\\{1,2}\|")
 
 environment = compile(
     r"\[//\]:\s(?:<>|#)\s\(%texenv begin (.*)\)(.+?)\[//\]:\s(?:<>|#)\s\(%texenv end \1\)",
     DOTALL+MULTILINE
 )
+# The begin or end line of an environment, found in linear time
+texenv_marker = compile(r"\[//\]:\s(?:<>|#)\s\(%texenv (begin|end) (.*)\)")
 
 list_dash = compile(r"\n(^\s{0,3}\-\s+.*$\n)+\n", MULTILINE)
 list_ast = compile(r"\n^(\s{0,3}\*\s+.*?\n)+\n", MULTILINE)
@@ -35,6 +82,38 @@ emph_1usc = compile(r"(?<!_)_{1}(\w[^\*\n]*?\w)_{1}(?!_)",)
 
 comment = compile(r"\[//\]:\s+(?:<>|#)\s+\((.*)\)")
 comment_cmd = compile(r"%\s*(\w*)\s*(.*)")
+include = compile(r"^\[//\]:\s+(?:<>|#)\s+\(%\s*include\s+(.+?)\s*\)", MULTILINE)
 
 single_quotations = compile(r"(?<![\w'])'{1}([^']+?)'{1}(?![\w'])")
 double_quotations = compile(r'(?<![\w"])"{1}([^"]+?)"{1}(?![\w"])')
+# Marks that may open, and close, the quotations above
+single_quotation_opening = compile(r"(?<![\w'])'")
+single_quotation_closing = compile(r"'(?![\w'])")
+double_quotation_opening = compile(r'(?<![\w"])"')
+double_quotation_closing = compile(r'"(?![\w"])')
+
+texenvarg = compile(r"\[//\]:\s(?:<>|#)\s\(%texenvarg (.*)\)\n")
+
+placeholder = compile(r"<[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}>")
+latex_symb = compile(r"\\LaTeX(?!\{)")
+paragraph_break = compile(r"\n\n")
+# A line starting a plain paragraph: not a list item, quote, code fence,
+# table row, header, image or comment (to be used with ``match(text, pos)``)
+plain_line = compile(r"[ \t]{0,3}[^\s\d\-*+>`|#!\[:]")
+usepackage = compile(r"^\\usepackage(?:\[.*\])?\{(.+)\}", MULTILINE)
+
+@lru_cache(maxsize=32)
+def header_commands(commands: tuple[str, ...]):
+    """Return a pattern matching the lines made of one of the passed header
+    commands, as written by the ``sections`` stage, with its title.
+    """
+    return compile(
+        r"^\\(" + "|".join(escape(c) for c in commands) + r")\{(.*)\}[ \t]*$", MULTILINE
+    )
+
+@lru_cache(maxsize=32)
+def any_of(strings: tuple[str, ...]):
+    """Return a pattern matching, in a single pass, every position where
+    any of the passed strings starts (overlapping occurrences included).
+    """
+    return compile("(?=" + "|".join(escape(s) for s in strings) + ")")
@@ -1,14 +1,21 @@
 import argparse
+from functools import lru_cache
 from pathlib import Path
 from typing import Sequence, Mapping, Any
 
-from mdtk.config import config, defaults, packages
+from mdtk.config import config, defaults, packages, load_project_config, ResolvedConfig
+from mdtk.files import COMPRESSIONS, available_compressions, compression_suffix
 from mdtk.fonts import is_font
+from mdtk.highlighting import validate_style
+from mdtk.stages import validate_stages
+from mdtk.transliteration import ENGINES
 from mdtk._exceptions import ValidationError
 
 _ON_OFF = ["ON", "OFF"]
 _NUMBERS = ("zero", "one", "two", "three", "four", "five", "six")
 _TYPES = ("pdf", "tex", "odt", "doc", "docx")
+# Output types that can be written compressed
+_COMPRESSIBLE_TYPES = ("tex",)
 _DOCUMENT_CLASSES = ("book", "report", "article", "extbook", "extreport", "extarticle")
 _SUPPORTED_SIZES = {
     "book": (10, 11, 12),
@@ -30,8 +37,18 @@ _DEFAULT_HEADERS = (
     "subparagraph",
 )
 
-def get_parsers():
+_HEADER_KEYS = tuple(f"header{number}" for number in _NUMBERS)
+
+
+def _strip_compression(path: str):
+    # "notes.md.gz" is "notes.md", compressed
+    suffix = compression_suffix(path)
+    return str(path)[:-len(suffix)] if suffix else str(path)
+
+def get_parsers(defaults_=None):
     # pylint: disable=W0621
+    if defaults_ is None:
+        defaults_ = defaults
 
     parser = argparse.ArgumentParser(add_help=True, formatter_class=argparse.RawTextHelpFormatter)
 
@@ -40,6 +57,7 @@ def get_parsers():
     parser_main.add_argument("input", action="store", metavar="INPUT")
     parser_main.add_argument("-o", "--output", action="store", default=None, metavar="OUTPUT")
     parser_main.add_argument("-t", "--type", action="store", default="tex", metavar="TYPE")
+    parser_main.add_argument("-E", "--engine", action="store", choices=tuple(ENGINES), metavar="ENGINE")
     parser_main.add_argument("-d", "--documentclass", action="store", choices=_DOCUMENT_CLASSES, metavar="DOCUMENTCLASS")
     parser_main.add_argument("-f", "--font", action="store", metavar="FONT", type=str)
     parser_main.add_argument("-s", "--size", action="store", metavar="SIZE", type=int, default=None)
@@ -47,18 +65,34 @@ def get_parsers():
     parser_main.add_argument("-A", "--author", action="store", default="", metavar="AUTHOR")
     parser_main.add_argument("-D", "--date", action="store", default="", metavar="DATE")
     parser_main.add_argument("-C", "--table-of-contents", action="store", choices=_ON_OFF, metavar="TABLE_OF_CONTENTS")
+    parser_main.add_argument("--full-preamble", action="store", choices=_ON_OFF, metavar="FULL_PREAMBLE")
+    parser_main.add_argument("-H", "--highlight", action="store", metavar="STYLE")
     parser_main.add_argument("-1", "--header-one-is-title", action="store", choices=_ON_OFF, metavar="HEADER_ONE_IS_TITLE")
     parser_main.add_argument("-e", "--escape", action="store", dest="escape_characters", metavar="ESCAPE_CHARACTERS")
     parser_main.add_argument("-B", "--break-ligatures", action="store", nargs='*', metavar="LIGATURES")
     parser_main.add_argument("-L", "--latex-symb", action="store", choices=_ON_OFF, metavar="LATEX_SYMB")
     parser_main.add_argument("-v", "--verbose", action="count", default=0)
+    parser_main.add_argument("--max-memory", action="store", type=int, default=None, metavar="MiB")
+    parser_main.add_argument("--profile-memory", action="store_true")
+    parser_main.add_argument("-j", "--jobs", action="store", type=int, default=None, metavar="JOBS")
+    parser_main.add_argument("--split", action="store_true")
+    parser_main.add_argument("--force", action="store_true")
+    parser_main.add_argument("-M", action="store_true", dest="make_depfile")
+    parser_main.add_argument("-MF", "--depfile", action="store", default=None, metavar="DEPFILE")
+    parser_main.add_argument("-k", "--keep-going", action="store_true")
+    parser_main.add_argument("--report", action="store", nargs="?", const="", default=None, metavar="REPORT")
+    parser_main.add_argument("--stages", action="store", metavar="STAGES")
+    parser_main.add_argument("--skip-stages", action="store", metavar="STAGES")
     parser_main.add_argument("--use-emph",
                             action="store",
                             nargs='*',
                             choices=["single", "double"],
                             dest="use_emph",
                             )
-    parser_main.set_defaults(**{k: v for k, v in defaults.items() if not k.startswith("pkg_")})
+    parser_main.set_defaults(**{
+        k: v for k, v in defaults_.items()
+        if not k.startswith("pkg_") and k not in _HEADER_KEYS
+    })
 
     parser_package = subparsers.add_parser("package")
 
@@ -71,32 +105,66 @@ def get_parsers():
         for pkg in pkglst:
             parser_package.add_argument(f"--pkg-{pkg}-args", action="store", metavar="PKGARGS") #, nargs="*"
 
-    parser_package.set_defaults(**{k: v for k, v in defaults.items() if k.startswith("pkg_")})
+    parser_package.set_defaults(**{k: v for k, v in defaults_.items() if k.startswith("pkg_")})
 
     parser_header = subparsers.add_parser("header")
     for number in _NUMBERS:
         parser_header.add_argument(f"--header{number}", action="store", metavar="HEADER")
+    parser_header.set_defaults(**{k: v for k, v in defaults_.items() if k in _HEADER_KEYS})
     
     return parser, parser_main, parser_package, parser_header
 
 parser, parser_main, parser_package, parser_header = get_parsers()
 
+@lru_cache(maxsize=8)
+def _get_project_parsers(project_config):
+    """Parsers whose defaults are those of ``defaults.yaml``, overridden
+    by the project file.
+    """
+    allowed = {
+        action.dest
+        for parser_ in (parser_main, parser_package, parser_header)
+        for action in parser_._actions # pylint: disable=W0212
+    }
+    unknown = sorted(set(project_config) - allowed)
+    if unknown:
+        raise ValueError(
+            f"Unknown settings in the project file: {', '.join(unknown)}."
+        )
+    return get_parsers({**defaults, **project_config})
+
 
 class App:
 
     input: Path
     output: Path
+    compression: str
     type: str
+    types: Sequence[str]
+    engine: str
     documentclass: str
     title: str
     date: str
     font: str
     size: int
     header_one_is_title: bool
+    full_preamble: bool
+    highlight: str | None
     escape: Sequence[str]
     break_hyphen_ligatures: bool
     latex_symb: bool
     verbose: bool
+    max_memory: int | None
+    profile_memory: bool
+    jobs: int | None
+    split: bool
+    force: bool
+    make_depfile: bool
+    depfile: Path | None
+    keep_going: bool
+    report: Path | None
+    stages: Sequence[str] | None
+    skip_stages: Sequence[str]
     use_emph: Sequence[str]
     headers: Mapping[int, str]
     pkg: Mapping[str, bool]
@@ -108,6 +176,8 @@ class App:
     def __init__(self, args=None):
         if args is None:
             args = []
+        self._parsers = (parser, parser_main, parser_package, parser_header)
+        self._resolved = None
         namespace, unknown_args = self._parse_arguments(args)
         self._set_args(namespace)
         header_args, unknown_args = self._parse_headers(unknown_args)
@@ -129,10 +199,15 @@ class App:
             setattr(self, arg, value)
 
     def _parse_arguments(self, args):
-        namespace, unknown_args = parser.parse_known_args(["main"] + args)
-        if not namespace.input.lower().endswith(".md"):
+        namespace, unknown_args = self._parsers[0].parse_known_args(["main"] + args)
+        project_config = load_project_config(Path(namespace.input).resolve().parent)
+        if project_config:
+            self._parsers = _get_project_parsers(project_config)
+            namespace, unknown_args = self._parsers[0].parse_known_args(["main"] + args)
+        if not _strip_compression(namespace.input).lower().endswith(".md"):
             raise ValueError(
-                f'Input file "{namespace.input}" must end in ".md"'
+                f'Input file "{namespace.input}" must end in ".md", '
+                f'optionally followed by one of: {", ".join(COMPRESSIONS)}'
             )
         if namespace.font:
             if not is_font(namespace.font):
@@ -150,11 +225,26 @@ class App:
             )
         namespace = self._transform_namespace(namespace)
         namespace.input = self._normalize_input_path(namespace.input)
+        types = self._split_types(namespace.type)
+        namespace.compression = compression_suffix(namespace.output or "")
         namespace.output, namespace.type = self._normalize_output_path_and_type(
-            namespace.output,
+            namespace.output and _strip_compression(namespace.output),
             namespace.input,
-            namespace.type
+            types[0]
+        )
+        # The type of the output suffix is added to those requested, not
+        # substituted for the first of them
+        namespace.types = tuple(dict.fromkeys([*types, namespace.type]))
+        self._validate_compression(namespace.compression, namespace.types)
+        namespace.depfile = self._normalize_depfile_path(
+            namespace.depfile, namespace.make_depfile, namespace.output
         )
+        namespace.report = self._normalize_report_path(namespace.report, namespace.output)
+        # A report is only useful if the conversion goes on after a problem
+        namespace.keep_going = namespace.keep_going or namespace.report is not None
+        namespace.highlight = self._normalize_highlight(namespace.highlight)
+        namespace.stages = self._split_stages(namespace.stages)
+        namespace.skip_stages = self._split_stages(namespace.skip_stages) or ()
         namespace.break_ligatures = [
             _LIGATURE_KEYS.get(lig, lig) for lig in namespace.break_ligatures
         ]
@@ -188,11 +278,14 @@ class App:
             f"header{_NUMBERS[i]}": _DEFAULT_HEADERS[i + offset]
             for i in range(2, 7)
         })
-        parser_header.set_defaults(**default_headers)
-        return parser.parse_known_args(["header"] + args)
+        namespace, unknown_args = self._parsers[0].parse_known_args(["header"] + args)
+        for key, value in default_headers.items():
+            if getattr(namespace, key) is None:
+                setattr(namespace, key, value)
+        return namespace, unknown_args
     
     def _parse_package_args(self, args):
-        namespace = parser.parse_args(["package"] + args)
+        namespace = self._parsers[0].parse_args(["package"] + args)
         namespace = self._transform_namespace(namespace)
         namespace_dct = vars(namespace)
         used_packages = []
@@ -240,9 +333,26 @@ class App:
             f"File {input_} not found."
         )
 
+    @staticmethod
+    def _split_types(type_: str):
+        types = [el.strip().lower() for el in type_.split(",") if el.strip()]
+        if not types:
+            raise ValueError("At least one output type must be passed.")
+        for el in types:
+            App._validate_type(el)
+        return types
+
+    @staticmethod
+    def _validate_type(type_: str):
+        if type_ not in _TYPES:
+            raise ValueError(
+                f'Output type "{type_}" is not valid. '
+                f'Valid types are: {", ".join(_TYPES)}.'
+            )
+
     @staticmethod
     def _normalize_output_path_and_type(output: str | None, path_in: Path, type_: str):
-        default_name = path_in.name.rstrip(path_in.suffix) + f".{type_}"
+        default_name = f"{Path(_strip_compression(path_in.name)).stem}.{type_}"
         default_dir = (
             path_in.parent
             if config.default_output_dir_as_input_dir
@@ -252,15 +362,69 @@ class App:
             if type_ is None:
                 raise ValidationError("Both output and type were None.")
             return default_dir / default_name, type_
-        if "." in str(output):
-            type_ = str(output).rsplit(".", 1)[1]
         path_out = Path(output)
         if not path_out.is_absolute():
-            path_out = default_dir / path_out, type_
+            path_out = default_dir / path_out
         if path_out.is_dir():
             return path_out / default_name, type_
+        if path_out.suffix:
+            type_ = path_out.suffix[1:].lower()
+            App._validate_type(type_)
         return path_out, type_
 
+    @staticmethod
+    def _validate_compression(compression: str, types: Sequence[str]):
+        if not compression:
+            return
+        if not any(type_ in _COMPRESSIBLE_TYPES for type_ in types):
+            raise ValueError(
+                f'Output types {", ".join(types)} cannot be compressed. '
+                f'Compressible types are: {", ".join(_COMPRESSIBLE_TYPES)}.'
+            )
+        if compression not in available_compressions():
+            raise ValueError(
+                f'Compression "{compression}" is not available '
+                "(zstd needs Python 3.14 or the 'zstandard' package). "
+                f'Available compressions are: {", ".join(available_compressions())}.'
+            )
+
+    @staticmethod
+    def _normalize_depfile_path(depfile: str | None, make_depfile: bool, path_out: Path):
+        if depfile is not None:
+            return Path(depfile).absolute()
+        if make_depfile:
+            return path_out.with_suffix(".d")
+        return None
+
+    @staticmethod
+    def _normalize_report_path(report: str | None, path_out: Path):
+        if report is None:
+            return None
+        if not report:
+            return path_out.with_suffix(".report.json")
+        return Path(report).absolute()
+
+    @staticmethod
+    def _split_stages(stages: str | Sequence[str] | None):
+        # Comma-separated on the command line, a list in the project file
+        if stages is None:
+            return None
+        if isinstance(stages, str):
+            stages = stages.split(",")
+        stages = tuple(stage.strip() for stage in stages if stage.strip())
+        validate_stages(stages)
+        return stages
+
+    @staticmethod
+    def _normalize_highlight(highlight: str | bool | None):
+        # ON is the default style of Pygments, OFF disables highlighting
+        if highlight is True:
+            highlight = "default"
+        if not highlight:
+            return None
+        validate_style(highlight)
+        return highlight
+
     @staticmethod
     def _transform_namespace(namespace, from_=None, into=None):
         if from_ is None:
@@ -278,6 +442,19 @@ class App:
                 continue
         return namespace
 
+    @property
+    def resolved(self) -> ResolvedConfig:
+        """Frozen snapshot of the conversion settings."""
+        if self._resolved is None:
+            self._resolved = ResolvedConfig.from_object(self)
+        return self._resolved
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # Parsers are only needed to parse the arguments, and cannot be pickled
+        state["_parsers"] = None
+        return state
+
     def update(self, *args, **kwargs):
         args = tuple(filter(lambda x: x is not None, args))
         if all(isinstance(arg, dict) for arg in args):
@@ -289,3 +466,4 @@ class App:
             )
         for key, value in kwargs.items():
             setattr(self, key, value)
+        self._resolved = None
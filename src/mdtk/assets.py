@@ -0,0 +1,166 @@
+import hashlib
+import os
+import shutil
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from warnings import warn
+
+from mdtk.config import config
+
+__all__ = [
+    "AssetPipeline",
+]
+
+_RASTER_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif")
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def _file_hash(path: Path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _jpeg_size(f):
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        length = struct.unpack(">H", f.read(2))[0]
+        if marker[1] in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+def _raster_size(path: Path):
+    """Return the (width, height) in pixels of a PNG, JPEG or GIF image,
+    read from its header, or None if the format is not recognized.
+    """
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if header.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", header[16:24])
+        if header[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", header[6:10])
+        if header.startswith(b"\xff\xd8"):
+            return _jpeg_size(f)
+    return None
+
+def _svg_to_pdf_command(source: Path, target: Path):
+    if shutil.which("rsvg-convert"):
+        return ["rsvg-convert", "-f", "pdf", "-o", str(target), str(source)]
+    if shutil.which("inkscape"):
+        return ["inkscape", f"--export-filename={target}", str(source)]
+    return None
+
+def _downsample_command(source: Path, target: Path, max_pixels: int):
+    for tool in ("magick", "convert"):
+        if shutil.which(tool):
+            return [tool, str(source), "-resize", f"{max_pixels}x{max_pixels}>", str(target)]
+    return None
+
+
+class AssetPipeline:
+    """Images referenced by a document, and the conversions they need.
+
+    SVG images are converted to PDF, and PNG, JPEG or GIF images larger than
+    ``asset_max_pixels`` (in ``config.yaml``) are downsampled. Converted files
+    are stored in ``asset_dir`` (next to the output) under the hash of their
+    source content, so unchanged images are never converted twice.
+    Image paths are relative to ``source_dir``; the paths returned by
+    ``resolve`` are relative to ``output_dir``, where LaTeX is run.
+    """
+
+    def __init__(self, source_dir: Path, output_dir: Path):
+        self.source_dir = Path(source_dir)
+        self.output_dir = Path(output_dir)
+        self.asset_dir = self.output_dir / config.asset_dir
+        self.jobs = {}
+        # Local image files referenced by the document
+        self.sources = []
+        # Targets of the conversions that failed in the last `run`
+        self.failed = []
+
+    def _relative(self, path: Path):
+        return Path(os.path.relpath(path, self.output_dir)).as_posix()
+
+    def _target(self, source: Path):
+        suffix = source.suffix.lower()
+        if suffix == ".svg":
+            return self.asset_dir / f"{_file_hash(source)}.pdf"
+        if suffix in _RASTER_SUFFIXES:
+            size = _raster_size(source)
+            if size is not None and max(size) > config.asset_max_pixels:
+                return self.asset_dir / f"{_file_hash(source)}-{config.asset_max_pixels}px{suffix}"
+        return None
+
+    @staticmethod
+    def _command(source: Path, target: Path):
+        if target.suffix == ".pdf":
+            return _svg_to_pdf_command(source, target)
+        return _downsample_command(source, target, config.asset_max_pixels)
+
+    def resolve(self, path: str) -> str:
+        """Return the path LaTeX must use for the image ``path``, and
+        register its conversion if it needs one.
+        """
+        if "://" in path:
+            warn(f"Remote image '{path}' cannot be included.")
+            return path
+        source = self.source_dir / path
+        if not source.is_file():
+            warn(f"Image '{source}' not found.")
+            return path
+        self.sources.append(source)
+        target = self._target(source)
+        if target is None:
+            return self._relative(source)
+        if not target.exists() and target not in self.jobs:
+            # Tools write to a temporary file, renamed once the conversion
+            # succeeded, so that an interrupted conversion is never cached
+            partial = target.with_name(f"{target.stem}.part{target.suffix}")
+            command = self._command(source, partial)
+            if command is None:
+                warn(f"No tool found to convert image '{source}'.")
+                return self._relative(source)
+            self.jobs[target] = command
+        return self._relative(target)
+
+    def merge(self, other: "AssetPipeline"):
+        """Add the images and conversions registered by ``other``, e.g. in
+        a worker process, to this pipeline.
+        """
+        self.sources.extend(other.sources)
+        for target, command in other.jobs.items():
+            self.jobs.setdefault(target, command)
+
+    def run(self, max_workers=None):
+        """Run the pending conversions in parallel. Return the number of
+        images converted; the targets of the conversions that failed are
+        in ``failed``.
+        """
+        self.failed = []
+        if not self.jobs:
+            return 0
+        self.asset_dir.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                lambda command: subprocess.run(command, check=False, capture_output=True),
+                self.jobs.values(),
+            ))
+        converted = 0
+        for (target, command), result in zip(self.jobs.items(), results):
+            partial = target.with_name(f"{target.stem}.part{target.suffix}")
+            if result.returncode != 0 or not partial.exists():
+                warn(f"Command {' '.join(command)} failed: {result.stderr.decode(errors='replace')}")
+                partial.unlink(missing_ok=True)
+                self.failed.append(target)
+                continue
+            os.replace(partial, target)
+            converted += 1
+        self.jobs = {}
+        return converted
@@ -1,10 +1,12 @@
 # pylint: disable=W0613
 
-import re
+from pathlib import PurePosixPath
 from textwrap import dedent
 
+from mdtk import _expressions as xpr
+
 __all__ = [
-    "time", "texenv", "texenvarg", "textag", "execute", "lstcommands"
+    "time", "texenv", "texenvarg", "textag", "include", "execute", "lstcommands"
 ]
 
 def time(*args, **kwargs):
@@ -44,14 +46,19 @@ def textag(text, position, args):
         )
     )
 
+def include(text, position, args):
+    if len(args) != 1:
+        raise ValueError(f"'%include' takes exactly one file name, got: {args}.")
+    path = PurePosixPath(args[0])
+    if path.is_absolute():
+        raise ValueError(f"'%include' only takes relative paths, got: {path}.")
+    return f"\\include{{{path.with_suffix('')}}}", {}, None
+
 def _find_line_from_position(text: str, position: int):
-    line_breaks = [0] + [i for i, c in enumerate(text) if c == "\n"]
-    for line, (start, end) in enumerate(
-        zip(line_breaks[:-1], line_breaks[1:]), start=1
-    ):
-        if position >= start and position < end:
-            return line
-    raise ValueError(f"Wrong position: {position}")
+    if not 0 <= position < len(text):
+        raise ValueError(f"Wrong position: {position}")
+    # A line break counts as the first character of the next line
+    return text.count("\n", 0, position + 1) + 1
 
 def _find_line_from_occurence(text: str, occurrence: str):
     for line_num, line_str in enumerate(text.split("\n"), start=1):
@@ -60,7 +67,7 @@ def _find_line_from_occurence(text: str, occurrence: str):
     raise ValueError(f"Occurrence not found: {occurrence}")
 
 def _isolate_block(text: str, position: int):
-    block_breaks = [0] + [match_.start() for match_ in re.finditer(r"\n\n", text)]
+    block_breaks = [0] + [match_.start() for match_ in xpr.paragraph_break.finditer(text)]
     for start, end in zip(block_breaks[:-1], block_breaks[1:]):
         if position >= start and position < end:
             return text[start:end].strip()
@@ -70,16 +77,17 @@ def execute(command, args, text, position=None):
     error_msg = (
         "'%{command}' (line {line}) is not a valid command. Commands include: {lst}."
     )
-    if position is not None:
-        line = _find_line_from_position(text, position)
-    else:
-        line = _find_line_from_occurence(text, command)
+    def _line():
+        # Only needed for error messages, and linear in the size of the text
+        if position is not None:
+            return _find_line_from_position(text, position)
+        return _find_line_from_occurence(text, command)
     if command not in globals():
-        raise ValueError(error_msg.format(command=command, line=line, lst=lstcommands()))
+        raise ValueError(error_msg.format(command=command, line=_line(), lst=lstcommands()))
         # return MarkdownParser._to_comment(f"{command} {' '.join(args)}"), None
     cmd = globals()[command]
     if not callable(cmd):
-        raise TypeError(error_msg.format(command=command, line=line, lst=lstcommands()))
+        raise TypeError(error_msg.format(command=command, line=_line(), lst=lstcommands()))
     new_text, new_cfg, text_action = cmd(text=text, position=position, args=args)
     if text_action is not None:
         raise NotImplementedError
@@ -1,12 +1,17 @@
-from dataclasses import dataclass
+import hashlib
+import json
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
 from pathlib import Path
-from typing import Sequence, Mapping
+from typing import Sequence, Mapping, Any
 from yaml import safe_load
 from importlib.resources import files # add files from data dir
 
 __all__ = [
     "config",
     "defaults",
+    "ResolvedConfig",
+    "load_project_config",
 ]
 
 # search for files in data dir in mdtk package dir once the package is installed
@@ -18,10 +23,19 @@ PATH_PACKAGE_CHOICES = DATA_DIR / "packages.yaml"
 PATH_DATA = DATA_DIR / "data"
 PATH_FONTS = DATA_DIR / "fonts.txt"
 PATH_FONT_USAGE = DATA_DIR / "font_usages.json"
+PROJECT_CONFIG_NAME = "mdtk.yaml"
 
 @dataclass
 class Config:
     default_output_dir_as_input_dir: bool
+    render_cache_size: int
+    regex_backend: str
+    asset_dir: str
+    asset_max_pixels: int
+    longtable_threshold: int
+    split_min_size: int
+    highlight_cache: str | None
+    timing_history: str | None
 
 @dataclass
 class Packages:
@@ -42,6 +56,91 @@ class Packages:
         functionality = dct
         return cls(on_off=on_off, functionality=functionality)
 
+class FrozenDict(dict):
+    """Immutable, hashable dict."""
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+    def _immutable(self, *args, **kwargs):
+        raise TypeError(f"'{type(self).__name__}' object is immutable")
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+def _freeze(value):
+    if isinstance(value, Mapping):
+        return FrozenDict({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(el) for el in value)
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+@dataclass(frozen=True)
+class ResolvedConfig:
+    """Conversion settings, as resolved by ``App`` from the command line,
+    the project file and ``defaults.yaml``.
+
+    Frozen and hashable, so that it can be used as a cache key, and cheap
+    to pickle, so that it can be sent to worker processes.
+    """
+    documentclass: str
+    size: int | None
+    font: str | None
+    title: str
+    author: str
+    date: str
+    table_of_contents: bool
+    full_preamble: bool
+    highlight: str | None
+    engine: str
+    header_one_is_title: bool
+    escape_characters: str
+    latex_symb: bool
+    break_ligatures: Sequence[str]
+    use_emph: Sequence[str]
+    headers: Mapping[int, str]
+    packages: Sequence[str]
+    pkg: Mapping[str, bool]
+    cmd: Mapping[str, str]
+    env: Mapping[str, str]
+    env_args: Mapping[str, Any]
+    stages: Sequence[str] | None
+    skip_stages: Sequence[str]
+
+    def __post_init__(self):
+        for field in fields(self):
+            object.__setattr__(self, field.name, _freeze(getattr(self, field.name)))
+
+    @classmethod
+    def from_object(cls, obj):
+        return cls(**{field.name: getattr(obj, field.name) for field in fields(cls)})
+
+    def replace(self, **changes):
+        return replace(self, **changes)
+
+    def digest(self) -> str:
+        """Return a hash of the settings which, unlike ``hash``, is the same
+        in every process, so that it can be stored.
+        """
+        settings = {field.name: getattr(self, field.name) for field in fields(self)}
+        dump = json.dumps(settings, sort_keys=True, default=lambda value: sorted(value, key=str))
+        return hashlib.sha256(dump.encode()).hexdigest()
+
+@lru_cache(maxsize=32)
+def _load_project_config(path: Path, mtime_ns: int): # pylint: disable=W0613
+    with open(path, "r", encoding="utf-8") as f:
+        return _freeze(safe_load(f) or {})
+
+def load_project_config(directory: Path):
+    """Return the settings of the project file (``mdtk.yaml``) in ``directory``,
+    or an empty mapping if there is none. Files are only read again when
+    they change.
+    """
+    path = Path(directory) / PROJECT_CONFIG_NAME
+    if not path.is_file():
+        return FrozenDict()
+    return _load_project_config(path, path.stat().st_mtime_ns)
+
 with open(PATH_CONFIG, "r", encoding="utf-8") as f:
     config = Config(**safe_load(f))
 
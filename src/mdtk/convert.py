@@ -1,48 +1,103 @@
 #pylint: disable=E0203,E1101
 
-import re
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
 from functools import partial
 from uuid import uuid4
-from warnings import warn
-from typing import Sequence, Mapping, Any
+from warnings import warn, catch_warnings, simplefilter
+from typing import Sequence
 
 from mdtk import _expressions as xpr
+from .config import config
 from ._exceptions import CommandError
 from .app import App
 from .commands import execute
-from .environment import LatexEnvironment, LatexDocument
+from .diagnostics import Diagnostic
+from .environment import LatexEnvironment, LatexDocument, render_environment
+from .headers import HeaderIndex
+from .highlighting import highlight_blocks
+from .profiling import MemoryProfiler
+from .split import split_positions
+from .stages import BUILTIN_STAGES, is_triggered, pipeline
+from .transliteration import translation_table
 
-_REGEX_ESCAPE_CHARACTERS = "\\$^.+*"
+# Features used by the LaTeX environments a `%texenv` may name
+_ENVIRONMENT_FEATURES = {
+    "Verbatim": "code",
+    "displayquote": "quote",
+    "quoting": "quote",
+    "itemize": "list",
+    "enumerate": "list",
+    "description": "list",
+    "longtable": "longtable",
+}
 
 class MarkdownParser:
 
-    def __init__(self, markdown, cfg=None, **kwargs):
+    # Names of the built-in conversion stages, in the order they are
+    # applied. The stages to run are chosen in `mdtk.stages`
+    STAGES = BUILTIN_STAGES
+
+    def __init__(
+        self, markdown, cfg=None, profiler=None, assets=None, jobs=1,
+        source=None, keep_going=False, project=None, **kwargs
+    ):
         self.markdown = markdown
+        # Number of processes a large document is split between
+        self.jobs = jobs
+        # File of the document, for diagnostics
+        self.source = source
+        # Whether failing constructs are reported in `diagnostics` and left
+        # unconverted, rather than aborting the conversion
+        self.keep_going = keep_going
+        self.diagnostics = []
+        # Line of `markdown` in `source`, for the pieces of a split document
+        self.first_line = 1
+        self._line_search = self._line_position = 0
+        self._line = 1
+        # Labels of the other files of a multi-file project (`ProjectLabels`)
+        self.project = project
         self._latex = None
-        self.cfg = cfg or App()
-        for key, value in kwargs.items():
-            setattr(cfg, key, value)
+        self._document = None
+        cfg = cfg or App()
+        if isinstance(cfg, App):
+            cfg = cfg.resolved
+        self.cfg = cfg.replace(**kwargs) if kwargs else cfg
+        self.profiler = profiler or MemoryProfiler()
+        self.assets = assets
+        # Text kept out of the later stages, restored at the end of parse_body
+        self._deferred = {}
+        # Features used by the document, which decide the packages it loads
+        self.features = set()
+        # Headers of the document, and the placeholders of their labels
+        prefix = project.prefix(source) if project is not None and source is not None else ""
+        self.headers = HeaderIndex(prefix)
+        self._header_placeholders = {}
+        # Links to headers, as (file, label, line); the file is None for
+        # the headers of the document when it is not part of a project
+        self.header_links = []
     
     @property
-    def code_environment_factory(self):
+    def code_environment_renderer(self):
         cfg = self.cfg
         return partial(
-            LatexEnvironment, name=cfg.env["verbatim"],
+            render_environment, name=cfg.env["verbatim"],
             args=cfg.env_args.get("verbatim"), indent_content=False
         )
     
     @property
-    def quote_environment_factory(self):
+    def quote_environment_renderer(self):
         cfg = self.cfg
         return partial(
-            LatexEnvironment, name=cfg.env["quote"],
+            render_environment, name=cfg.env["quote"],
             args=cfg.env_args.get("quote"), indent_content=True
         )
 
     @property
     def latex(self):
         if self._latex is None:
-            self._latex = self.parse()
+            self._latex = str(self.document)
         return self._latex
     
     @property
@@ -60,22 +115,117 @@ class MarkdownParser:
         for i in range(6, 1, -1):
             search = xpr.headers[i]
             replace = rf"\\{cfg.headers[i]}{{\1}}"
-            text = re.sub(search, replace, text)
+            text = search.sub(replace, text)
         if cfg.headers[1] != "title":
-            text = re.sub(xpr.headers[1], rf"\\{cfg.headers[1]}{{\1}}", text)
+            text = xpr.headers[1].sub(rf"\\{cfg.headers[1]}{{\1}}", text)
         else:
-            title_match = re.search(xpr.headers[1], text)
+            title_match = xpr.headers[1].search(text)
             if title_match is not None:
-                cfg.title = title_match.groups()[0] # pylint: disable=W0201
-            text = re.sub(xpr.headers[1], "", text)
+                self.cfg = cfg.replace(title=title_match.groups()[0])
+            text = xpr.headers[1].sub("", text)
         return text
+
+    def labels(self, text):
+        """Labels of the headers, which are added to the header index"""
+        commands = tuple(sorted(set(self.cfg.headers.values()) - {"title", None}))
+        # `sections` also converts the lines of code blocks starting with #
+        code_blocks = [match_.span() for match_ in xpr.block_code.finditer(text)]
+        starts = [start for start, _ in code_blocks]
+
+        def _label(match_):
+            i = bisect_right(starts, match_.start()) - 1
+            if i >= 0 and match_.start() < code_blocks[i][1]:
+                return match_.group()
+            header = self.headers.add(*match_.groups())
+            # Labels must not go through emphasis or ligatures
+            placeholder = self._defer(f"\\label{{{header.label}}}")
+            self._header_placeholders[placeholder] = len(self.headers) - 1
+            return match_.group() + placeholder
+
+        return xpr.header_commands(commands).sub(_label, text)
+
+    def _index_titles(self, text):
+        # The titles of the index, as converted by the stages after `labels`
+        for match_ in xpr.placeholder.finditer(text):
+            i = self._header_placeholders.get(match_.group())
+            if i is None:
+                continue
+            header = self.headers.headers[i]
+            line = text[text.rfind("\n", 0, match_.start()) + 1:match_.start()]
+            title = xpr.header_commands((header.command,)).search(line)
+            if title is not None:
+                title = self._unshield(title.group(2).strip(), self._deferred)
+                self.headers.headers[i] = header._replace(title=title)
     
     @staticmethod
     def inline_code(text):
         """Inline literal code"""
-        text = re.sub(xpr.inline_code, r"\\texttt{\1}", text)
+        text = xpr.inline_code.sub(r"\\texttt{\1}", text)
         return text
 
+    def _iter_table(self, text, header, delimiter, rows):
+        """LaTeX code of a table, one row at a time.
+        ``header`` and ``delimiter`` are (start, end) spans, ``rows`` a list of them.
+        """
+        alignments = [
+            _table_alignment(cell)
+            for cell in _split_table_row(text[delimiter[0]:delimiter[1]])
+        ]
+        ncols = len(alignments)
+        if self.cfg.pkg.get("longtable") and len(rows) > config.longtable_threshold:
+            name, endhead = "longtable", "    \\endhead\n"
+            self.features.add("longtable")
+        else:
+            name, endhead = "tabular", ""
+        yield f"\\begin{{{name}}}{{{''.join(alignments)}}}\n    \\hline\n"
+        yield _table_row(text[header[0]:header[1]], ncols)
+        yield "    \\hline\n" + endhead
+        for start, end in rows:
+            yield _table_row(text[start:end], ncols)
+        yield f"    \\hline\n\\end{{{name}}}\n"
+
+    def tables(self, text):
+        """GFM pipe tables, as tabular, or longtable if they are long"""
+        if "|" not in text:
+            return text
+        code_spans = [match_.span() for match_ in xpr.block_code.finditer(text)]
+        chunks = []
+        end_p = 0
+        for match_ in xpr.table_delimiter.finditer(text):
+            start, end = match_.span()
+            if start < end_p or any(s <= start < e for s, e in code_spans):
+                continue
+            # The header is the line right before the delimiter row
+            header_start = text.rfind("\n", 0, max(start - 1, 0)) + 1
+            header = (header_start, max(start - 1, header_start))
+            if (
+                start == 0 or header_start < end_p
+                or "|" not in text[header[0]:header[1]]
+                or len(_split_table_row(text[header[0]:header[1]]))
+                != len(_split_table_row(match_.group()))
+            ):
+                continue
+            # Body rows go on until a blank line or a line without pipes
+            rows = []
+            row_start = end + 1
+            while row_start < len(text):
+                row_end = text.find("\n", row_start)
+                if row_end == -1:
+                    row_end = len(text)
+                row = text[row_start:row_end]
+                if not row.strip() or "|" not in row:
+                    break
+                rows.append((row_start, row_end))
+                row_start = row_end + 1
+            table_end = rows[-1][1] if rows else end
+            chunks.append(text[end_p:header_start])
+            chunks.extend(self._iter_table(text, header, (start, end), rows))
+            end_p = table_end + 1
+        if not chunks:
+            return text
+        chunks.append(text[end_p:])
+        return "".join(chunks)
+
     def block_code(self, text):
         """Block literal code"""
         def _convert_arg(arg):
@@ -86,50 +236,84 @@ class MarkdownParser:
             return ""
 
         cfg = self.cfg
-        TexEnv = self.code_environment_factory # pylint: disable=C0103
-        
+        render = self.code_environment_renderer
+        env_args = _as_list(cfg.env_args.get("verbatim"))
+        highlighted = self._highlight_blocks(text)
+        # A replaced block cannot start a block before it, so each search
+        # goes on from the last block
+        start = 0
         while True:
-            match_ = re.search(xpr.block_code, text)
+            match_ = xpr.block_code.search(text, start)
             if match_ is None:
                 break
+            self.features.add("code")
             arg, content = match_.groups()
             start, end = match_.span()
-            texenv = TexEnv(content=content)
-            if arg:
-                texenv.args.append(_convert_arg(arg))
-            text = text[:start] + str(texenv) + text[end:]
+            # The language is the first word of the info string
+            block = (arg.split()[0] if arg.strip() else "", content)
+            if block in highlighted:
+                self.features.add("highlight")
+                # Highlighted code must not go through the later stages
+                texenv = self._defer(render(
+                    content=highlighted[block],
+                    args=["commandchars=\\\\\\{\\}", *env_args, _convert_arg(arg)],
+                ))
+            elif arg:
+                texenv = render(content=content, args=env_args + [_convert_arg(arg)])
+            else:
+                texenv = render(content=content)
+            text = text[:start] + texenv + text[end:]
         return text
 
+    def _highlight_blocks(self, text):
+        # Highlighted code of the blocks with a language, all highlighted at
+        # once, so that those missing from the cache can be in parallel.
+        # Pygments writes the commands of fancyvrb's Verbatim
+        if not self.cfg.highlight or not self.cfg.pkg["fancyvrb"]:
+            return {}
+        blocks = [
+            (arg.split()[0], content)
+            for arg, content in (match_.groups() for match_ in xpr.block_code.finditer(text))
+            if arg.strip()
+        ]
+        if not blocks:
+            return {}
+        with self.profiler.stage("highlight"):
+            return highlight_blocks(blocks, self.cfg.highlight, self.jobs)
+
     def block_quotes(self, text):
         """Block quotes"""
-        TexEnv = self.quote_environment_factory # pylint: disable=C0103
-
+        render = self.quote_environment_renderer
+        start = 0
         while True:
-            match_ = re.search(xpr.block_quotes, text)
+            match_ = xpr.block_quotes.search(text, start)
             if match_ is None:
                 break
+            self.features.add("quote")
             content, _ = match_.groups()
             content = "\n".join([line.strip("> ") for line in content.split("\n")])
             start, end = match_.span()
-            texenv = TexEnv(content=content)
-            text = text[:start] + str(texenv) + text[end:]
+            texenv = render(content=content)
+            text = text[:start] + texenv + text[end:]
         return text
         
     def environments(self, text):
         while True:
-            match_ = re.search(xpr.environment, text)
+            match_ = xpr.environment.search(text)
             if match_ is None:
                 break
             name, content = match_.groups()
+            if name in _ENVIRONMENT_FEATURES:
+                self.features.add(_ENVIRONMENT_FEATURES[name])
             start, end = match_.span()
-            texenv = LatexEnvironment(name=name, content=content)
-            text = text[:start] + str(texenv) + text[end:]
+            texenv = render_environment(name=name, content=content)
+            text = text[:start] + texenv + text[end:]
         return text
 
     @classmethod
     def _get_shielded_positions_href(cls, text):
         shielded_positions = []
-        for match_ in re.finditer(xpr.href, text):
+        for match_ in xpr.href.finditer(text):
             start, _ = match_.span()
             group = match_.group()
 
@@ -140,6 +324,10 @@ class MarkdownParser:
 
             shielded_positions.append(span_link)
 
+        # Image paths, also when the alternative text is empty
+        for match_ in xpr.image.finditer(text):
+            shielded_positions.append(match_.span(2))
+
         return shielded_positions
 
     @classmethod
@@ -151,7 +339,7 @@ class MarkdownParser:
             xpr.headerany,
         )
         for pattern in shield_patterns:
-            for match_ in re.finditer(pattern, text):
+            for match_ in pattern.finditer(text):
                 shielded_positions.append(match_.span())
         # Extend with positions coming from hrefs
         shielded_positions.extend(
@@ -162,30 +350,106 @@ class MarkdownParser:
     @classmethod
     def _shield(cls, text):
         positions = cls._get_shielded_positions(text)
-        masked_text = ""
+        chunks = []
         placeholders = {}
         end_p = 0
         for start, end in positions:
             placeholder = f"<{uuid4()}>"
             shielded_text = text[start:end]
             placeholders[placeholder] = shielded_text
-            masked_text += text[end_p:start] + placeholder
+            chunks.append(text[end_p:start])
+            chunks.append(placeholder)
             end_p = end
-        masked_text += text[end_p:]
-        return masked_text, placeholders
+        chunks.append(text[end_p:])
+        return "".join(chunks), placeholders
     
     @classmethod
     def _unshield(cls, text, placeholders):
-        for placeholder, shielded_text in placeholders.items():
-            text = re.sub(_regex_escape(placeholder), shielded_text, text)
-        return text
+        if not placeholders:
+            return text
+        return xpr.placeholder.sub(
+            lambda match_: placeholders.get(match_.group(), match_.group()), text
+        )
 
-    @staticmethod
-    def href(text):
-        return re.sub(xpr.href, r"\\href{\2}{\1}", text)
+    def _defer(self, latex):
+        placeholder = f"<{uuid4()}>"
+        self._deferred[placeholder] = latex
+        return placeholder
+
+    def images(self, text):
+        """Images, as figures when alone in their line, inline otherwise"""
+        def _path(path):
+            if self.assets is not None:
+                path = self.assets.resolve(path)
+            # Image paths must not go through emphasis, quotes or ligatures
+            return self._defer(path)
+
+        def _figure(match_):
+            alt, path = match_.groups()
+            content = f"\\centering\n\\includegraphics[width=\\linewidth]{{{_path(path)}}}"
+            if alt:
+                content += f"\n\\caption{{{alt}}}"
+            return render_environment(name="figure", args="h", content=content)
+
+        def _inline(match_):
+            _, path = match_.groups()
+            return f"\\includegraphics{{{_path(path)}}}"
+
+        if "![" not in text:
+            return text
+        self.features.add("image")
+        text = xpr.image_block.sub(_figure, text)
+        return xpr.image.sub(_inline, text)
+
+    def _resolve(self, target):
+        if self.project is not None and self.source is not None:
+            return self.project.resolve(self.source, target)
+        if target.startswith("#") and len(target) > 1:
+            return None, target[1:]
+        return None
+
+    def references(self, text):
+        """Links to headers, of the document or of another file of the project"""
+        def _reference(match_):
+            name, target = match_.groups()
+            # `escape` takes the targets starting with # for header titles
+            target = target.replace("\\", "")
+            resolved = self._resolve(target)
+            if resolved is None:
+                return match_.group()
+            path, label = resolved
+            self.header_links.append((path, label, self._markdown_line(f"({target})")))
+            # Labels must not go through emphasis or ligatures, nor their
+            # brackets through `href`
+            if self.cfg.pkg["hyperref"]:
+                self.features.add("link")
+                return self._defer(f"\\hyperref[{label}]") + f"{{{name}}}"
+            return f"{name}~" + self._defer(f"(\\ref{{{label}}})")
+
+        return xpr.href.sub(_reference, text)
+
+    def _check_references(self):
+        # Links are resolved by label, whether or not the header exists
+        source = Path(self.source).absolute() if self.source is not None else None
+        for path, label, line in self.header_links:
+            if path is None or path == source:
+                if label in self.headers:
+                    continue
+            elif label in self.project.labels(path, self.cfg.headers):
+                continue
+            message = f"Link to unknown header '{label}'."
+            if self.keep_going:
+                self._report("references", message, line=line, severity="warning")
+            else:
+                warn(message)
+
+    def href(self, text):
+        text, count = xpr.href.subn(r"\\href{\2}{\1}", text)
+        if count:
+            self.features.add("link")
+        return text
     
-    @staticmethod
-    def enumerate(text):
+    def enumerate(self, text):
         envs_patterns = [
             ("itemize", xpr.list_dash, lambda x: x.lstrip(" -")),
             ("itemize", xpr.list_ast, lambda x: x.lstrip(" *")),
@@ -193,10 +457,12 @@ class MarkdownParser:
             ("enumerate", xpr.list_num, lambda x: x.split(".", 1)[1])
         ]
         for env, pattern, strip_fun in envs_patterns:
+            start = 0
             while True:
-                match_ = re.search(pattern, text)
+                match_ = pattern.search(text, start)
                 if match_ is None:
                     break
+                self.features.add("list")
                 start, end = match_.span()
                 group = match_.group().strip(" \n")
                 content = "\n".join([
@@ -210,72 +476,67 @@ class MarkdownParser:
     def emph(self, text):
         cmd_double = self.cfg.cmd["double"]
         cmd_single = self.cfg.cmd["single"]
-        text = re.sub(xpr.emph_3ast, rf"\\{cmd_double}{{\\{cmd_single}{{\1}}}}", text)
-        text = re.sub(xpr.emph_3usc, rf"\\{cmd_double}{{\\{cmd_single}{{\1}}}}", text)
-        text = re.sub(xpr.emph_2ast, rf"\\{cmd_double}{{\1}}", text)
-        text = re.sub(xpr.emph_2usc, rf"\\{cmd_double}{{\1}}", text)
-        text = re.sub(xpr.emph_1ast, rf"\\{cmd_single}{{\1}}", text)
-        text = re.sub(xpr.emph_1usc, rf"\\{cmd_single}{{\1}}", text)
+        text = xpr.emph_3ast.sub(rf"\\{cmd_double}{{\\{cmd_single}{{\1}}}}", text)
+        text = xpr.emph_3usc.sub(rf"\\{cmd_double}{{\\{cmd_single}{{\1}}}}", text)
+        text = xpr.emph_2ast.sub(rf"\\{cmd_double}{{\1}}", text)
+        text = xpr.emph_2usc.sub(rf"\\{cmd_double}{{\1}}", text)
+        text = xpr.emph_1ast.sub(rf"\\{cmd_single}{{\1}}", text)
+        text = xpr.emph_1usc.sub(rf"\\{cmd_single}{{\1}}", text)
         return text
 
     @staticmethod
     def _escape(text: str, escape_characters: Sequence[str]):
-        escape_positions = set()
-        # Populate escape_positins (for all escape characteres)
-        for ch in escape_characters:
-            # List of spans of verbatims and comments in text
-            for match_ in re.finditer(_regex_escape(ch), text):
-                pos = match_.start()
-                escape_positions.add(pos)
-        # Add escape characters where necessary
-        # sorted and reversed so that already added escape characters don't mess
-        # with the numbering of the rest
-        text = list(text)
-        for pos in sorted(escape_positions, reverse=True):
-            text.insert(pos, "\\")
-        return "".join(text)
+        if not escape_characters:
+            return text
+        # The pattern matches the empty string in front of every escape
+        # character, so substituting inserts the backslashes in a single pass
+        return xpr.any_of(tuple(escape_characters)).sub(lambda _: "\\", text)
 
     @classmethod
-    def _escape_placeholders(cls, placeholders: Mapping[Any, str], escape_characters: Sequence[str]):
-        for placeholder, value in placeholders.items():
-            # Escape characters in titles
-            match_ = re.match(xpr.headerany, value)
-            if match_ is not None:
-                title = match_.groups()[0]
-                title_e = cls._escape(title, escape_characters=escape_characters)
-                placeholders[placeholder] = re.sub(title, title_e, value)
-                continue
-            # Escape characters in hrefs
-            match_ = re.match(xpr.href, value)
-            if match_ is not None:
-                name, a = match_.groups()
-                name_e = cls._escape(name, escape_characters=escape_characters)
-                a_e = cls._escape(a, escape_characters=set(escape_characters).intersection(["\\"]))
-                placeholders[placeholder] = re.sub(name, name_e, re.sub(a, a_e, value))
-                continue
-        return placeholders
-    
+    def _escape_shielded(cls, value: str, escape_characters: Sequence[str]):
+        # Escape characters in titles
+        match_ = xpr.headerany.match(value)
+        if match_ is not None:
+            title = match_.groups()[0]
+            title_e = cls._escape(title, escape_characters=escape_characters)
+            return value.replace(title, title_e)
+        # Escape characters in hrefs
+        match_ = xpr.href.match(value)
+        if match_ is not None:
+            name, a = match_.groups()
+            name_e = cls._escape(name, escape_characters=escape_characters)
+            a_e = cls._escape(a, escape_characters=set(escape_characters).intersection(["\\"]))
+            return value.replace(a, a_e).replace(name, name_e)
+        return value
+
     def escape(self, text):
         """Escape characters"""
-        # Positions in text to be escaped
         escape_characters = self.escape_characters
-        text, placeholders = MarkdownParser._shield(text)
-        text = self._escape(text, escape_characters=escape_characters)
-        placeholders = self._escape_placeholders(placeholders, escape_characters=escape_characters)
-        text = self._unshield(text, placeholders)
+        # The shielded constructs are escaped on their own, and the text
+        # between them as a whole, without setting either aside
+        chunks = []
+        end_p = 0
+        for start, end in self._get_shielded_positions(text):
+            self.profiler.check()
+            chunks.append(self._escape(text[end_p:start], escape_characters=escape_characters))
+            chunks.append(self._escape_shielded(text[start:end], escape_characters=escape_characters))
+            end_p = end
+        chunks.append(self._escape(text[end_p:], escape_characters=escape_characters))
+        text = "".join(chunks)
+        del chunks
 
         # FIX: ensure proper spacing after \LaTeX
-        text = re.sub(r"\\LaTeX(?!\{)", r"\\LaTeX{}", text) 
+        text = xpr.latex_symb.sub(r"\\LaTeX{}", text)
         return text
 
     def break_ligatures(self, text):
         def _break(l, t):
             while l in t:
-                t = re.sub(l, f"{l[0]}{{}}{l[1]}", t)
+                t = t.replace(l, f"{l[0]}{{}}{l[1:]}")
             return t
         cfg = self.cfg
         for lig in cfg.break_ligatures:
-            text = _break(_regex_escape(lig), text)
+            text = _break(lig, text)
         return text
     
     @staticmethod
@@ -284,81 +545,360 @@ class MarkdownParser:
 
     def comments(self, text):
         commands = set()
-        for comment in re.finditer(xpr.comment, text):
+        # Commands get the text of the stage, and the position of their
+        # comment in it: the output is built from the spans of the comments
+        chunks = []
+        end_p = 0
+        for comment in xpr.comment.finditer(text):
+            self.profiler.check()
             content = comment.groups()[0]
             position = comment.start()
-            if content[0] == "%":
-                match_ = re.match(xpr.comment_cmd, content)
-                if match_ is None:
-                    raise CommandError(content)
-                command, arg = match_.groups()
-                args = arg.split()
-                commands.add(command)
+            if content[:1] == "%":
                 try:
+                    match_ = xpr.comment_cmd.match(content)
+                    if match_ is None:
+                        raise CommandError(content)
+                    command, arg = match_.groups()
+                    args = arg.split()
+                    commands.add(command)
+                    if command == "include":
+                        self.features.add("include")
                     new_text, cfg = execute(command=command, args=args, text=text, position=position)
                 except NotImplementedError:
-                    warn(f"Not implemented: '{command}'.")
-                text = re.sub(comment.re, new_text, text)
-                self.cfg.update(cfg)
+                    # The command is kept as a LaTeX comment
+                    if self.keep_going:
+                        self._report("comments", f"Not implemented: '{command}'.",
+                                     line=self._markdown_line(comment.group()), severity="warning")
+                    else:
+                        warn(f"Not implemented: '{command}'.")
+                    new_text, cfg = self._to_comment(content), None
+                except (CommandError, ValueError, TypeError) as exc:
+                    if not self.keep_going:
+                        raise
+                    self._report("comments", str(exc), line=self._markdown_line(comment.group()))
+                    new_text, cfg = self._to_comment(content), None
+                if cfg:
+                    self.cfg = self.cfg.replace(**cfg)
             else:
-                text = re.sub(comment.re, self._to_comment(content), text)
-        return text
+                new_text = self._to_comment(content)
+            chunks.append(text[end_p:position])
+            chunks.append(new_text)
+            end_p = comment.end()
+        chunks.append(text[end_p:])
+        return "".join(chunks)
     
+    def _replace_quotations(self, text, mark, quotations, opening, closing):
+        """Replace the marks ``mark`` of the quotations of ``text`` by
+        ``quotations``, in a single pass over the marks.
+
+        The result is that of replacing the first quotation again and again:
+        a quotation ends at the next mark, so once a quotation inside another
+        is replaced, the marks of the outer one are next to each other.
+        """
+        # Marks that no quotation has taken yet, in order
+        pending = []
+        replaced = {}
+        position = text.find(mark)
+        while position >= 0:
+            self.profiler.check()
+            closes = closing.match(text, position) is not None
+            while (
+                pending and closes and position > pending[-1] + 1
+                and opening.match(text, pending[-1]) is not None
+            ):
+                replaced[pending.pop()] = quotations[0]
+                replaced[position] = quotations[1]
+                # A closing mark left as it is may close another quotation
+                if quotations[1] != mark:
+                    break
+            else:
+                pending.append(position)
+            position = text.find(mark, position + 1)
+        chunks = []
+        end_p = 0
+        for position in sorted(replaced):
+            chunks.append(text[end_p:position])
+            chunks.append(replaced[position])
+            end_p = position + 1
+        chunks.append(text[end_p:])
+        return "".join(chunks)
+
     def quotation_marks(self, text):
-        # pylint: disable=W0101
-        quotations_patterns = [
-            (("``", "''"), xpr.double_quotations),
-            (("`", "'"), xpr.single_quotations),
-        ]
         text, key = self._shield(text)
-        for quotations, pattern in quotations_patterns:
-            while True:
-                match_ = re.search(pattern, text)
-                if match_ is None:
-                    break
-                start, end = match_.span()
-                content = match_.groups()[0]
-                quotation_text = quotations[0] + content + quotations[1]
-                text = text[:start] + quotation_text + text[end:]
+        text = self._replace_quotations(
+            text, '"', ("``", "''"), xpr.double_quotation_opening, xpr.double_quotation_closing
+        )
+        text = self._replace_quotations(
+            text, "'", ("`", "'"), xpr.single_quotation_opening, xpr.single_quotation_closing
+        )
         return self._unshield(text, key)
-            
+
+
+    def transliterate(self, text):
+        """Unicode characters pdflatex cannot typeset, as LaTeX commands"""
+        cfg = self.cfg
+        table = translation_table(cfg.engine)
+        if not table:
+            return text
+        # The title may come from the first header, converted by `sections`
+        self.cfg = cfg.replace(**{
+            key: getattr(cfg, key).translate(table) for key in ("title", "author", "date")
+        })
+        if text.isascii():
+            return text
+        # Code, comments and link targets are kept as they are. The stage
+        # comes after `quotation_marks`, which would take the quotes of
+        # accents like \'{e} for quotation marks
+        positions = [
+            match_.span() for pattern in (xpr.block_code, xpr.comment)
+            for match_ in pattern.finditer(text)
+        ]
+        positions.extend(match_.span(1) for match_ in xpr.href_target.finditer(text))
+        chunks = []
+        end_p = 0
+        for start, end in sorted(positions):
+            if end <= end_p:
+                continue
+            start = max(start, end_p)
+            chunks.append(text[end_p:start].translate(table))
+            chunks.append(text[start:end])
+            end_p = end
+        chunks.append(text[end_p:].translate(table))
+        return "".join(chunks)
 
     def preamble(self, text):
-        return str(LatexDocument(text, self.cfg))
+        return str(LatexDocument(text, self.cfg, self.features))
 
-    def parse(self):
-        text = self.markdown
-        for fun in (
-            self.escape,
-            self.sections,
-            self.inline_code,
-            self.environments,
-            self.href,
-            self.enumerate,
-            self.emph,
-            self.quotation_marks,
-            self.comments,
-            self.block_code,
-            self.block_quotes,
-            self.break_ligatures,
-            self.preamble,
-        ):
-            text = fun(text)
+    @property
+    def document(self):
+        if self._document is None:
+            body = self.parse_body()
+            self._document = LatexDocument(body, self.cfg, self.features, self.headers)
+        return self._document
+
+    def write_to(self, fp):
+        """Write the converted document to the file object ``fp``."""
+        if self._latex is not None:
+            fp.write(self._latex)
+        else:
+            self.document.write_to(fp)
+
+    def _report(self, stage, message, line=None, severity="error"):
+        source = str(self.source) if self.source is not None else None
+        self.diagnostics.append(Diagnostic(source, line, stage, message, severity))
+
+    def _markdown_line(self, snippet):
+        # Line of `snippet` in the source. A stage finds constructs in the
+        # order of the document, so the search, and the count of lines,
+        # resume after the last one
+        position = self.markdown.find(snippet, self._line_search)
+        if position < 0:
+            position = self.markdown.find(snippet)
+            if position < 0:
+                return None
+            self._line_position, self._line = 0, self.first_line
+        self._line += self.markdown.count("\n", self._line_position, position)
+        self._line_position = position
+        self._line_search = position + 1
+        return self._line
+
+    @property
+    def stages(self):
+        """Stages to run, as selected by the ``stages`` and ``skip_stages``
+        settings.
+        """
+        return pipeline(self.cfg.stages, self.cfg.skip_stages)
+
+    def _stage_function(self, stage):
+        if stage.function is None:
+            return getattr(self, stage.name)
+        return partial(stage.function, self)
+
+    def _run_stage(self, stage, text):
+        name = stage.name
+        self._line_search = self._line_position = 0
+        self._line = self.first_line
+        if not self.keep_going:
+            return self._stage_function(stage)(text)
+        with catch_warnings(record=True) as caught:
+            simplefilter("always")
+            try:
+                text = self._stage_function(stage)(text)
+            except MemoryError:
+                raise
+            except Exception as exc: # pylint: disable=W0718
+                # The text is left as the stage found it
+                self._report(name, f"{type(exc).__name__}: {exc}")
+        for warning in caught:
+            self._report(name, str(warning.message), severity="warning")
         return text
 
-def _regex_escape(s):
-    if len(s) > 1:
-        return "".join([_regex_escape(c) for c in s])
-    if s in _REGEX_ESCAPE_CHARACTERS:
-        return "\\" + s
-    return s
+    def _run_stages(self, text, comment_cfg=None):
+        for stage in self.stages:
+            self.profiler.check()
+            # Stages whose triggers are not in the text would leave it as is
+            if is_triggered(stage, self, text):
+                with self.profiler.stage(stage.name):
+                    text = self._run_stage(stage, text)
+            if stage.name == "comments" and comment_cfg:
+                self.cfg = self.cfg.replace(**comment_cfg)
+        if self._header_placeholders:
+            self._index_titles(text)
+        text = self._unshield(text, self._deferred)
+        self._deferred = {}
+        return text
+
+    def _comment_cfg(self):
+        """Configuration set by the commands in the comments of the whole
+        document, in order.
+        """
+        cfg = {}
+        for comment in xpr.comment.finditer(self.markdown):
+            match_ = xpr.comment_cmd.match(comment.groups()[0])
+            if match_ is None:
+                continue
+            command, arg = match_.groups()
+            try:
+                _, new_cfg = execute(
+                    command=command, args=arg.split(), text=self.markdown, position=comment.start()
+                )
+            except (CommandError, ValueError, TypeError, NotImplementedError):
+                # The errors of the commands, raised again or reported when
+                # the piece with the command is converted
+                continue
+            cfg.update(new_cfg or {})
+        return cfg
+
+    def _parse_pieces(self, positions):
+        """Convert the pieces of the document between ``positions``, and
+        return their bodies.
+        """
+        # The configuration set by comments applies to the stages that follow
+        # `comments` in every piece, not only in the piece of the comment
+        run_comments = any(stage.name == "comments" for stage in self.stages)
+        comment_cfg = self._comment_cfg() if run_comments else {}
+        options = {
+            "cfg": self.cfg, "assets": self.assets, "source": self.source,
+            "keep_going": self.keep_going, "project": self.project,
+        }
+        spans = list(zip(positions[:-1], positions[1:]))
+        first_lines = []
+        line = self.first_line
+        for start, end in spans:
+            first_lines.append(line)
+            line += self.markdown.count("\n", start, end)
+        with self.profiler.stage("pieces"):
+            if self.jobs > 1:
+                pieces = [self.markdown[start:end] for start, end in spans]
+                with ProcessPoolExecutor(max_workers=len(pieces)) as executor:
+                    results = list(executor.map(
+                        _parse_piece, pieces, first_lines,
+                        [options] * len(pieces), [comment_cfg] * len(pieces),
+                    ))
+            else:
+                # In this process, the stages of the pieces are profiled too,
+                # and each piece is only copied out of the document when due
+                options["profiler"] = self.profiler
+                results = [
+                    _parse_piece(self.markdown[start:end], first_line, options, comment_cfg)
+                    for (start, end), first_line in zip(spans, first_lines)
+                ]
+        # The title comes from the first header one of the document
+        titles = [piece["title"] for _, piece in results if piece["title"] != self.cfg.title]
+        if titles:
+            self.cfg = self.cfg.replace(title=titles[0])
+        if comment_cfg:
+            self.cfg = self.cfg.replace(**comment_cfg)
+        bodies = []
+        for body, piece in results:
+            if self.assets is not None and piece["assets"] is not self.assets:
+                self.assets.merge(piece["assets"])
+            self.features.update(piece["features"])
+            self.diagnostics.extend(piece["diagnostics"])
+            self.header_links.extend(piece["header_links"])
+            # Labels are unique in each piece, and made unique in the document
+            renamed = self.headers.merge(piece["headers"])
+            if renamed:
+                body = xpr.label.sub(
+                    lambda match_: f"\\label{{{renamed.get(match_.group(1), match_.group(1))}}}",
+                    body,
+                )
+            bodies.append(body)
+        return bodies
+
+    def parse_body(self):
+        # A large document is converted piece by piece: on `jobs` processes,
+        # or else one piece after the other. The memory of the stages is
+        # then that of a piece, and so is the time of the stages that search
+        # the text again after each replacement
+        positions = split_positions(self.markdown, self.jobs if self.jobs > 1 else len(self.markdown))
+        if len(positions) > 2:
+            bodies = self._parse_pieces(positions)
+        else:
+            bodies = [self._run_stages(self.markdown)]
+        # Only once every header of the document is known
+        self._check_references()
+        # Only needed for the lines of diagnostics, which the stages report,
+        # and released before the body is joined
+        self.markdown = None
+        return "".join(bodies)
+
+    def parse(self):
+        return self.preamble(self.parse_body())
+
+def _parse_piece(piece, first_line, options, comment_cfg):
+    md_parser = MarkdownParser(piece, **options)
+    md_parser.first_line = first_line
+    body = md_parser._run_stages(piece, comment_cfg) # pylint: disable=W0212
+    return body, {
+        "title": md_parser.cfg.title,
+        "assets": md_parser.assets,
+        "features": md_parser.features,
+        "headers": md_parser.headers,
+        "diagnostics": md_parser.diagnostics,
+        "header_links": md_parser.header_links,
+    }
+
+def _split_table_row(row: str):
+    row = row.strip()
+    if row.startswith("|"):
+        row = row[1:]
+    if row.endswith("|") and not row.endswith("\\|"):
+        row = row[:-1]
+    return [cell.strip() for cell in xpr.table_cell_separator.split(row)]
+
+def _table_alignment(cell: str):
+    if cell.startswith(":") and cell.endswith(":"):
+        return "c"
+    if cell.endswith(":"):
+        return "r"
+    return "l"
+
+def _table_row(row: str, ncols: int):
+    cells = _split_table_row(row)[:ncols]
+    cells += [""] * (ncols - len(cells))
+    cells = [xpr.table_escaped_pipe.sub(r"\\textbar{}", cell) for cell in cells]
+    return "    " + " & ".join(cells) + " \\\\\n"
+
+def _as_list(args):
+    if args is None:
+        return []
+    if isinstance(args, str):
+        return [args]
+    return list(args)
 
 def _filter_and_validate_positions(positions: Sequence[tuple[int, int]]):
     filtered_positions = []
     for start1, end1 in sorted(positions):
-        if any(start2 <= start1 <= end1 <= end2 for (start2, end2) in filtered_positions):
+        if not filtered_positions:
+            filtered_positions.append((start1, end1))
+            continue
+        # Kept ranges are sorted and disjoint, so only the last one can
+        # contain, or overlap, the ranges that start after it
+        start2, end2 = filtered_positions[-1]
+        if start2 <= start1 <= end1 <= end2:
             continue
-        if any(start2 <= start1 <= end2 <= end1 for (start2, end2) in filtered_positions):
+        if start2 <= start1 <= end2 <= end1:
             raise ValueError(
                 "One position range partially contains another: "
                 "(start1 < start2 < end1 < end2)"
@@ -0,0 +1,57 @@
+import os
+from pathlib import Path
+
+from .config import (
+    PATH_CONFIG,
+    PATH_DEFAULTS,
+    PATH_PACKAGE_CHOICES,
+    PATH_FONTS,
+    PATH_FONT_USAGE,
+    PROJECT_CONFIG_NAME,
+)
+from .files import write_text
+
+__all__ = [
+    "DATA_DEPENDENCIES",
+    "project_dependencies",
+    "format_depfile",
+    "write_depfile",
+]
+
+# Data files every conversion depends on
+DATA_DEPENDENCIES = tuple(
+    Path(str(path))
+    for path in (PATH_CONFIG, PATH_DEFAULTS, PATH_PACKAGE_CHOICES, PATH_FONTS, PATH_FONT_USAGE)
+)
+
+
+def project_dependencies(input_: Path):
+    """Return the project file of the document ``input_``, in a list, if it has one."""
+    path = Path(input_).parent / PROJECT_CONFIG_NAME
+    return [path] if path.is_file() else []
+
+def _make_path(path: Path):
+    # Relative to the working directory, where make runs, when possible
+    path = Path(path).absolute()
+    relative = os.path.relpath(path)
+    if not relative.startswith(".."):
+        path = Path(relative)
+    return path.as_posix().replace("$", "$$").replace("#", "\\#").replace(" ", "\\ ")
+
+def format_depfile(targets, prerequisites) -> str:
+    """Return a Makefile rule making every path of ``targets`` depend on
+    every path of ``prerequisites``.
+    """
+    prerequisites = list(dict.fromkeys(_make_path(path) for path in prerequisites))
+    rules = [
+        " ".join(_make_path(path) for path in targets) + ":"
+        + "".join(f" \\\n  {path}" for path in prerequisites)
+    ]
+    # An empty rule per prerequisite (as with `gcc -MP`), so that make does
+    # not fail when one of them is deleted
+    rules.extend(f"{path}:" for path in prerequisites)
+    return "\n\n".join(rules) + "\n"
+
+def write_depfile(path: Path, targets, prerequisites) -> bool:
+    """Write the dependency file ``path``. Return whether it changed."""
+    return write_text(path, format_depfile(targets, prerequisites))
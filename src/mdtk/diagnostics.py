@@ -0,0 +1,49 @@
+import json
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Iterable, Optional
+
+from .files import write_text
+
+__all__ = [
+    "Diagnostic",
+    "format_report",
+    "write_report",
+]
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    """Problem found while converting a document: the construct it was
+    found in was left unconverted, or converted with a fallback.
+    ``line`` is the line in ``file``, if known; ``stage`` is the conversion
+    stage, or step of the conversion, that raised it.
+    """
+    file: Optional[str]
+    line: Optional[int]
+    stage: str
+    message: str
+    severity: str = "error"
+
+    def __str__(self):
+        location = self.file or "<string>"
+        if self.line is not None:
+            location += f":{self.line}"
+        return f"{location}: {self.severity} in {self.stage}: {self.message}"
+
+
+def format_report(diagnostics: Iterable[Diagnostic], input_: Optional[Path] = None) -> str:
+    """Return the JSON report of ``diagnostics``, found when converting ``input_``."""
+    diagnostics = list(diagnostics)
+    return json.dumps({
+        "input": str(input_) if input_ is not None else None,
+        "errors": sum(diagnostic.severity == "error" for diagnostic in diagnostics),
+        "warnings": sum(diagnostic.severity == "warning" for diagnostic in diagnostics),
+        "diagnostics": [asdict(diagnostic) for diagnostic in diagnostics],
+    }, indent=2) + "\n"
+
+def write_report(path: Path, diagnostics: Iterable[Diagnostic], input_: Optional[Path] = None):
+    """Write the JSON report of ``diagnostics`` into ``path``, unless it
+    already contains it. Return whether ``path`` was written.
+    """
+    return write_text(path, format_report(diagnostics, input_))
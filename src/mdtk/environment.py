@@ -1,50 +1,146 @@
-from re import finditer, sub
-from typing import Optional
-from textwrap import indent as indent_
-from .app import App
+from functools import lru_cache
+from typing import Optional, Iterable, Iterator, TextIO, Sequence, Set
+from mdtk import _expressions as xpr
+from .config import config, ResolvedConfig
 from .fonts import get_font_usage
+from .headers import Header, format_toc
+from .highlighting import style_definitions
+from .transliteration import ENGINES
+
+_INDENT = " " * 4
+
+# Feature of the document without which a package is not loaded. Packages
+# not listed here are always loaded
+_PACKAGE_FEATURES = {
+    "inputenc": "unicode",
+    "enumitem": "list",
+    "hyperref": "link",
+    "graphicx": "image",
+    "longtable": "longtable",
+    "fancyvrb": "code",
+    "csquotes": "quote",
+    "quoting": "quote",
+}
+
 
 class LatexDocument:
-    def __init__(self, document, cfg: App):
+    """LaTeX document with the converted ``document`` as body.
+
+    ``features`` are the features used by the document (as recorded by
+    ``MarkdownParser``): packages only needed by other features are left
+    out of the preamble, unless ``cfg.full_preamble`` is set. Without
+    ``features``, or if the document includes chapters, whose features are
+    unknown, every package is loaded. ``headers`` are the headers of the
+    document, from which its table of contents is built.
+    """
+    __slots__ = ("document", "cfg", "features", "headers")
+
+    def __init__(
+        self,
+        document,
+        cfg: ResolvedConfig,
+        features: Optional[Set[str]] = None,
+        headers: Optional[Iterable[Header]] = None,
+    ):
         self.document = document
         self.cfg = cfg
-        self.preamble = self._build_preamble()
-        self.latex = self._build_latex()
+        self.features = features
+        self.headers = headers
+
+    @property
+    def preamble(self):
+        return "".join(self._iter_preamble())
+
+    @property
+    def latex(self):
+        return "".join(self._iter_latex())
+
+    def _used_features(self):
+        if self.features is None or self.cfg.full_preamble or "include" in self.features:
+            return None
+        features = set(self.features)
+        if not all(
+            text.isascii()
+            for text in (self.document, self.cfg.title, self.cfg.author, self.cfg.date)
+        ):
+            features.add("unicode")
+        return features
+
+    def _loads(self, pkg: str):
+        features = self._used_features()
+        return pkg in self.cfg.packages and (
+            features is None or _PACKAGE_FEATURES.get(pkg) in (None, *features)
+        )
+
+    def toc(self, pages=None) -> Optional[str]:
+        """Return the content of the ``.toc`` file of the document, built
+        from its ``headers``, with the page numbers in ``pages`` (see
+        ``mdtk.headers.format_toc``). Return None if the table of contents
+        is not known before the engine runs: without ``headers``, or if the
+        document includes chapters.
+        """
+        if self.headers is None or "include" in (self.features or ()):
+            return None
+        return format_toc(self.headers, self.cfg.documentclass, self._loads("hyperref"), pages)
+
+    def _iter_usepackages(self) -> Iterator[str]:
+        features = self._used_features()
+        for pkg, usepackage in (
+            # Only pdflatex does not read Unicode natively
+            *((("inputenc", "\\usepackage[utf8]{inputenc}\n"),) if ENGINES[self.cfg.engine] else ()),
+            ("geometry", "\\usepackage[a4paper]{geometry}\n"),
+            ("enumitem", "\\usepackage{enumitem}\n"),
+            *((pkg, f"\\usepackage{{{pkg}}}\n") for pkg in self.cfg.packages),
+        ):
+            if features is None or _PACKAGE_FEATURES.get(pkg) in (None, *features):
+                yield usepackage
+        if self.cfg.font:
+            yield get_font_usage(self.cfg.font)
+        if self.cfg.highlight and "highlight" in (self.features or ()):
+            yield "\\usepackage{color}\n"
+            yield style_definitions(self.cfg.highlight)
 
-    def _build_preamble(self):
-        preamble = ""
+    def _iter_preamble(self) -> Iterator[str]:
         if self.cfg.size:
-            preamble += f"\\documentclass[{self.cfg.size}pt]{{{self.cfg.documentclass}}}\n"
+            yield f"\\documentclass[{self.cfg.size}pt]{{{self.cfg.documentclass}}}\n"
         else:
-            preamble += f"\\documentclass{{{self.cfg.documentclass}}}\n"
-        preamble += "\\usepackage[utf8]{inputenc}\n"
-        preamble += "\\usepackage[a4paper]{geometry}\n"
-        preamble += "\\usepackage{enumitem}\n"
-        for pkg in self.cfg.packages:
-            preamble += f"\\usepackage{{{pkg}}}\n"
-        if self.cfg.font:
-            preamble += get_font_usage(self.cfg.font)
-        preamble += f"\\title{{{self.cfg.title}}}\n"
-        preamble += f"\\author{{{self.cfg.author}}}\n"
-        preamble += f"\\date{{{self.cfg.date}}}\n\n"
-        return preamble
-
-    def _build_latex(self):
-        document = ""
-        document += self.preamble
-        document += "\n\\begin{document}\n\n"
-        document += "\\maketitle\n\n"
+            yield f"\\documentclass{{{self.cfg.documentclass}}}\n"
+        # The same package is never loaded twice, e.g. by a font
+        seen = set()
+        for fragment in self._iter_usepackages():
+            for line in fragment.splitlines(keepends=True):
+                if xpr.usepackage.match(line):
+                    if line.strip() in seen:
+                        continue
+                    seen.add(line.strip())
+                yield line
+        yield f"\\title{{{self.cfg.title}}}\n"
+        yield f"\\author{{{self.cfg.author}}}\n"
+        yield f"\\date{{{self.cfg.date}}}\n\n"
+
+    def _iter_latex(self) -> Iterator[str]:
+        yield from self._iter_preamble()
+        yield "\n\\begin{document}\n\n"
+        yield "\\maketitle\n\n"
         if self.cfg.table_of_contents:
-            document += "\\tableofcontents\n\n"
-        document += self.document
-        document += "\n\n\\end{document}\n"
-        return document
+            yield "\\tableofcontents\n\n"
+        yield self.document
+        yield "\n\n\\end{document}\n"
+
+    def write_to(self, fp: TextIO):
+        """Write the document to the file object ``fp`` fragment by fragment,
+        without building the whole LaTeX string in memory.
+        """
+        for fragment in self._iter_latex():
+            fp.write(fragment)
 
     def __str__(self):
         return self.latex
 
 
 class LatexEnvironment:
+    __slots__ = ("name", "args", "content", "indent", "curly", "newline")
+
     def __init__(self,
                  name: str,
                  args: Optional[list[str]] = None,
@@ -71,20 +167,27 @@ class LatexEnvironment:
     def _get_indent(default, *args):
         return tuple((arg if arg is not None else default) for arg in args)
 
+    def _iter_content(self) -> Iterator[str]:
+        if not self.indent[1]:
+            yield self.content
+            return
+        # Same semantics as textwrap.indent: whitespace-only lines are kept as is
+        for line in self.content.splitlines(keepends=True):
+            if line.strip():
+                yield _INDENT
+            yield line
 
     def __str__(self):
+        # Environments are rendered into the body as strings (and cached,
+        # see `render_environment`); only the document is written in fragments
         sep = ",\n" if self.newline else ","
         if self.indent[0]:
             sep += " " * (9 + len(self.name))
         args_str = sep.join(list(filter(bool, self.args)))
         if args_str:
             args_str = f"[{args_str}]"
-        line_begin = f"\\begin{{{self.name}}}{args_str}"
-        line_end = f"\\end{{{self.name}}}"
-        content = self.content
-        if self.indent[1]:
-            content = indent_(content, " "*4)
-        return f"{line_begin}\n{content}\n{line_end}\n"
+        content = "".join(self._iter_content())
+        return f"\\begin{{{self.name}}}{args_str}\n{content}\n\\end{{{self.name}}}\n"
     
     def add_argument(self, argument):
         if isinstance(argument, list):
@@ -94,8 +197,35 @@ class LatexEnvironment:
     
     def parse(self):
         content = self.content
-        pattern_texenvarg = r"\[//\]:\s(?:<>|#)\s\(%texenvarg (.*)\)\n"
-        for match_ in finditer(pattern_texenvarg, content):
-            self.add_argument(match_.groups()[0].split())
-        content = sub(pattern_texenvarg, "", content)
+        if "%texenvarg" in content:
+            for match_ in xpr.texenvarg.finditer(content):
+                self.add_argument(match_.groups()[0].split())
+            content = xpr.texenvarg.sub("", content)
         self.content = content.strip()
+
+
+def render_environment(name: str, args: Optional[str | Sequence[str]] = None, content: str = "", **kwargs):
+    """Return the LaTeX code of the environment, as ``str(LatexEnvironment(...))``.
+
+    Results are memoized in a bounded LRU cache shared by every document
+    converted in the same process, so repeated identical blocks are parsed
+    and rendered only once.
+    """
+    if args is None:
+        args = ()
+    elif isinstance(args, str):
+        args = (args,)
+    else:
+        args = tuple(args)
+    return _render_environment(name, args, content, tuple(sorted(kwargs.items())))
+
+@lru_cache(maxsize=config.render_cache_size)
+def _render_environment(name, args, content, options):
+    return str(LatexEnvironment(name=name, args=list(args), content=content, **dict(options)))
+
+def render_cache_info():
+    """Return the hits, misses and size of the environment rendering cache."""
+    return _render_environment.cache_info()
+
+def clear_render_cache():
+    _render_environment.cache_clear()
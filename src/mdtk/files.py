@@ -0,0 +1,188 @@
+import bz2
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import tempfile
+from functools import lru_cache
+from importlib import import_module
+from pathlib import Path
+
+
+__all__ = [
+    "COMPRESSIONS",
+    "available_compressions",
+    "compression_suffix",
+    "read_markdown",
+    "AtomicWriter",
+    "write_text",
+]
+
+
+@lru_cache(maxsize=1)
+def _zstd():
+    # In the standard library from Python 3.14
+    for name in ("compression.zstd", "zstandard"):
+        try:
+            return import_module(name)
+        except ImportError:
+            continue
+    return None
+
+def _open_gzip(file, mode: str):
+    # Without file name nor time in the header, equal documents compress
+    # into equal files, which AtomicWriter then leaves untouched
+    return gzip.GzipFile(filename="", mode=mode, fileobj=file, mtime=0)
+
+def _open_zstd(file, mode: str):
+    zstd = _zstd()
+    if zstd is None:
+        raise OSError("Zstandard files need Python 3.14 or the 'zstandard' package.")
+    if zstd.__name__ == "compression.zstd":
+        return zstd.ZstdFile(file, mode)
+    return zstd.open(file, mode, closefd=False)
+
+# Compressed file formats, by suffix: their magic number, and the function
+# opening a binary file object (left open on close) through them
+COMPRESSIONS = {
+    ".gz": (b"\x1f\x8b", _open_gzip),
+    ".bz2": (b"BZh", bz2.BZ2File),
+    ".xz": (b"\xfd7zXZ\x00", lzma.LZMAFile),
+    ".zst": (b"\x28\xb5\x2f\xfd", _open_zstd),
+}
+_MAGIC_SIZE = max(len(magic) for magic, _ in COMPRESSIONS.values())
+
+
+def compression_suffix(path: Path) -> str:
+    """Return the suffix of ``path`` naming its compression, e.g. ``.gz``,
+    or an empty string if it has none.
+    """
+    suffix = Path(path).suffix.lower()
+    return suffix if suffix in COMPRESSIONS else ""
+
+def available_compressions() -> tuple[str, ...]:
+    """Return the suffixes of the compressions that can be read and written
+    with the installed modules.
+    """
+    return tuple(suffix for suffix in COMPRESSIONS if suffix != ".zst" or _zstd() is not None)
+
+def _detect_compression(header: bytes):
+    for suffix, (magic, _) in COMPRESSIONS.items():
+        if header.startswith(magic):
+            return suffix
+    return ""
+
+
+def _normalize_newlines(text: str):
+    # Same as the universal newlines mode of `open`
+    if "\r" not in text:
+        return text
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+def read_markdown(path: Path) -> str:
+    """Return the content of the Markdown file ``path``.
+
+    Compressed files (see ``COMPRESSIONS``) are recognized by their content,
+    whatever their suffix, and decompressed as they are read.
+    """
+    with open(path, "rb") as f:
+        compression = _detect_compression(f.read(_MAGIC_SIZE))
+        if compression:
+            f.seek(0)
+            return _read_compressed(f, compression, path)
+        f.seek(0)
+        return _normalize_newlines(f.read().decode("utf-8"))
+
+def _read_compressed(file, compression: str, path: Path):
+    _, open_ = COMPRESSIONS[compression]
+    errors = (EOFError, lzma.LZMAError)
+    if compression == ".zst" and _zstd() is not None:
+        errors += (_zstd().ZstdError,)
+    try:
+        with open_(file, "rb") as binary, io.TextIOWrapper(binary, encoding="utf-8") as text:
+            return text.read()
+    except errors as exc:
+        raise OSError(f"File {path} cannot be decompressed: {exc}") from exc
+
+
+def _file_hash(path: Path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**16), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+def _same_content(path1: Path, path2: Path):
+    if path1.stat().st_size != path2.stat().st_size:
+        return False
+    return _file_hash(path1) == _file_hash(path2)
+
+
+class AtomicWriter:
+    """Context manager writing a text file through a temporary file in the
+    same directory, renamed over ``path`` once fully written.
+
+    If ``path`` already has the same content, it is left untouched (and so
+    is its mtime), so that build tools do not see it as modified. After the
+    ``with`` block, ``changed`` tells whether ``path`` was replaced.
+
+    If the suffix of ``path`` names a compression (see ``COMPRESSIONS``),
+    the text is compressed as it is written.
+
+        with AtomicWriter(path) as writer:
+            writer.file.write(text)
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.file = None
+        self.changed = False
+        self._temp = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        compression = compression_suffix(self.path)
+        self._temp = tempfile.NamedTemporaryFile(
+            "wb" if compression else "w", encoding=None if compression else "utf-8",
+            dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".part", delete=False,
+        )
+        if compression:
+            _, open_ = COMPRESSIONS[compression]
+            try:
+                self.file = io.TextIOWrapper(open_(self._temp, "wb"), encoding="utf-8")
+            except BaseException:
+                self._temp.close()
+                Path(self._temp.name).unlink(missing_ok=True)
+                raise
+        else:
+            self.file = self._temp
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.file.close()
+        finally:
+            self._temp.close()
+        temp_path = Path(self._temp.name)
+        if exc_type is not None:
+            temp_path.unlink(missing_ok=True)
+            return False
+        if self.path.exists() and _same_content(temp_path, self.path):
+            temp_path.unlink()
+            return False
+        # NamedTemporaryFile creates files readable by their owner only
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.replace(temp_path, self.path)
+        self.changed = True
+        return False
+
+def write_text(path: Path, text: str) -> bool:
+    """Atomically write ``text`` into ``path``, unless ``path`` already
+    contains it. Return whether ``path`` was written.
+    """
+    with AtomicWriter(path) as writer:
+        writer.file.write(text)
+    return writer.changed
@@ -1,10 +1,10 @@
 import json
-import re
 from functools import partial
 from collections import defaultdict
 from collections.abc import Sequence, Mapping
 from typing import Callable
 
+from mdtk import _expressions as xpr
 from mdtk.config import PATH_FONTS, PATH_FONT_USAGE
 from mdtk._exceptions import NoFontFilesError
 
@@ -60,10 +60,9 @@ def _read_json_normalize(path):
         raise NoFontFilesError() from exc
    
 def _get_font_packages():
-    pattern = re.compile(r"^\\usepackage(?:\[.*\])?\{(.+)\}", re.MULTILINE)
     font_package_lists = defaultdict(list)
     for font, usage in _font_usage.items():
-        for match_ in re.finditer(pattern, usage):
+        for match_ in xpr.usepackage.finditer(usage):
             package = match_.groups()[0]
             font_package_lists[font].append(package)
     # Unfold font packages
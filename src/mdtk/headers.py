@@ -0,0 +1,276 @@
+"""Index of the headers of a converted document.
+
+Every header gets a unique ``\\label``, made from its title the way GitHub
+makes the anchors of Markdown headers (``## Getting started`` is
+``#getting-started``). From the index, the ``.toc`` file LaTeX reads at
+``\\tableofcontents`` is written before the engine runs, so that a single
+pass typesets the table of contents.
+"""
+import os
+import re
+import unicodedata
+from bisect import bisect_right
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple, Optional, Iterable, Mapping
+
+from mdtk import _expressions as xpr
+from .files import read_markdown
+
+__all__ = [
+    "Header",
+    "HeaderIndex",
+    "ProjectLabels",
+    "slugify",
+    "lower_headers",
+    "format_toc",
+    "read_toc_pages",
+]
+
+# Sectioning commands, from the highest level. Other header commands are
+# left out of the table of contents
+_LEVELS = ("part", "chapter", "section", "subsection", "subsubsection", "paragraph", "subparagraph")
+# Document classes with a known numbering: whether they have chapters,
+# and their default ``secnumdepth``
+_CLASSES = {
+    "article": (False, 3),
+    "extarticle": (False, 3),
+    "report": (True, 2),
+    "extreport": (True, 2),
+    "book": (True, 2),
+    "extbook": (True, 2),
+}
+
+_ESCAPED = re.compile(r"\\(.)")
+_LINK = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_NOT_SLUG = re.compile(r"[^\w\- ]")
+_CONTENTSLINE = re.compile(
+    r"^\\contentsline\s*\{(\w+)\}\{(?:\\numberline\s*\{([^}]*)\})?(.*?)\}\{([^{}]*)\}(?:\{[^{}]*\})?%?$"
+)
+
+
+class Header(NamedTuple):
+    command: str
+    title: str
+    # Anchor of the header in Markdown, and its unique LaTeX label
+    slug: str
+    label: str
+
+
+def slugify(title: str) -> str:
+    """Return the anchor of the header ``title``, in ASCII. The backslashes
+    of escaped characters and link targets are left out.
+    """
+    text = _LINK.sub(r"\1", _ESCAPED.sub(r"\1", title.strip()))
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return _NOT_SLUG.sub("", text.lower()).replace(" ", "-") or "header"
+
+def lower_headers(headers: Mapping[int, str]) -> dict[int, str]:
+    """Return the header commands ``headers`` (by Markdown level) one level
+    down: ``#`` takes the command of ``##``, and so on. The last level
+    takes the sectioning command below its own, if there is one.
+    """
+    lowered = dict(headers)
+    for level in range(1, 6):
+        lowered[level] = headers[level + 1]
+    if headers[6] in _LEVELS:
+        lowered[6] = _LEVELS[min(_LEVELS.index(headers[6]) + 1, len(_LEVELS) - 1)]
+    return lowered
+
+
+class HeaderIndex:
+    """Headers of a document, in order, with unique labels: the second
+    header with a given slug gets ``<slug>-1``, the third ``<slug>-2``...
+    """
+
+    def __init__(self, prefix: str = ""):
+        self.headers = []
+        # Prepended to the labels, e.g. to keep those of chapters apart
+        self.prefix = prefix
+        self._labels = set()
+
+    def __len__(self):
+        return len(self.headers)
+
+    def __iter__(self):
+        return iter(self.headers)
+
+    def __contains__(self, label: str):
+        return label in self._labels
+
+    def _unique(self, slug: str):
+        label = f"{self.prefix}{slug}"
+        count = 0
+        while label in self._labels:
+            count += 1
+            label = f"{self.prefix}{slug}-{count}"
+        self._labels.add(label)
+        return label
+
+    def add(self, command: str, title: str) -> Header:
+        slug = slugify(title)
+        header = Header(command, title.strip(), slug, self._unique(slug))
+        self.headers.append(header)
+        return header
+
+    def merge(self, other: "HeaderIndex") -> dict[str, str]:
+        """Add the headers of ``other``, e.g. those of a piece converted in
+        a worker process, after those of this index. Return the labels
+        that had to be renamed to stay unique, as ``{old: new}``.
+        """
+        renamed = {}
+        for header in other:
+            label = self._unique(header.slug)
+            if label != header.label:
+                renamed[header.label] = label
+            self.headers.append(header._replace(label=label))
+        return renamed
+
+
+@lru_cache(maxsize=256)
+def _scan_labels(path: Path, mtime_ns: int, levels: tuple[int, ...], prefix: str): # pylint: disable=W0613
+    text = read_markdown(path)
+    code_blocks = [match_.span() for match_ in xpr.block_code.finditer(text)]
+    starts = [start for start, _ in code_blocks]
+    index = HeaderIndex(prefix)
+    for match_ in xpr.headerany.finditer(text):
+        i = bisect_right(starts, match_.start()) - 1
+        if i >= 0 and match_.start() < code_blocks[i][1]:
+            continue
+        level = len(match_.group()) - len(match_.group().lstrip("#"))
+        if level in levels:
+            index.add("", match_.group(1))
+    return frozenset(header.label for header in index)
+
+
+class ProjectLabels:
+    """Labels of the headers of every file of a multi-file project: the
+    main document ``root``, and the ``chapters`` it includes.
+
+    LaTeX labels are shared by all the files, so those of a chapter are
+    prefixed with its path, relative to the main document and without
+    suffix: header ``## Setup`` of ``chapters/intro.md`` is labelled
+    ``chapters/intro:setup``. A link to ``chapters/intro.md#setup`` thus
+    resolves to that label from any file of the project. The labels of
+    the other files are found by a scan of their headers, done once per
+    version of each file and shared by every document of the process.
+    With ``header_one_is_title``, the ``#`` header of the main document is
+    its title; that of a chapter never is.
+    """
+
+    def __init__(
+        self, root: Path, chapters: Iterable[Path] = (), header_one_is_title: bool = False,
+    ):
+        self.root = Path(root).absolute()
+        self.files = {self.root, *(Path(chapter).absolute() for chapter in chapters)}
+        self.header_one_is_title = header_one_is_title
+
+    def prefix(self, path: Path) -> str:
+        path = Path(path).absolute()
+        if path == self.root:
+            return ""
+        relative = PurePosixPath(Path(os.path.relpath(path, self.root.parent)).as_posix())
+        return f"{relative.with_suffix('')}:"
+
+    def resolve(self, source: Path, target: str) -> Optional[tuple[Path, str]]:
+        """Return the file and the label a link to ``target`` in the file
+        ``source`` refers to, or None if ``target`` is not an anchor in a
+        file of the project.
+        """
+        path, _, anchor = target.partition("#")
+        if not anchor or "://" in path:
+            return None
+        source = Path(source).absolute()
+        path = Path(os.path.normpath(source.parent / path)) if path else source
+        if path not in self.files:
+            return None
+        return path, f"{self.prefix(path)}{anchor}"
+
+    def labels(self, path: Path, headers: Mapping[int, Optional[str]]) -> frozenset[str]:
+        """Return the labels of the headers of the file ``path``, converted
+        with the header commands ``headers`` (by level).
+        """
+        path = Path(path).absolute()
+        levels = {level for level, command in headers.items() if command not in (None, "title")}
+        if path != self.root:
+            levels.add(1)
+        elif self.header_one_is_title:
+            levels.discard(1)
+        return _scan_labels(path, path.stat().st_mtime_ns, tuple(sorted(levels)), self.prefix(path))
+
+
+def _roman(number: int):
+    numerals = (
+        (1000, "M"), (900, "CM"), (500, "D"), (400, "CD"), (100, "C"), (90, "XC"),
+        (50, "L"), (40, "XL"), (10, "X"), (9, "IX"), (5, "V"), (4, "IV"), (1, "I"),
+    )
+    roman = ""
+    for value, numeral in numerals:
+        while number >= value:
+            roman += numeral
+            number -= value
+    return roman
+
+def format_toc(
+    headers: Iterable[Header],
+    documentclass: str,
+    hyperref: bool,
+    pages: Optional[Mapping[tuple[str, str], str]] = None,
+) -> Optional[str]:
+    """Return the content of the ``.toc`` file LaTeX would write for
+    ``headers``, or None if ``documentclass`` numbers them in an unknown way.
+
+    Page numbers are only known once the document is typeset: they are
+    taken from ``pages`` (as returned by ``read_toc_pages``), and left
+    empty for new headers.
+    """
+    if documentclass not in _CLASSES:
+        return None
+    chapters, secnumdepth = _CLASSES[documentclass]
+    pages = pages or {}
+    # Numbers start from the chapter, or from the section without chapters
+    first = 1 if chapters else 2
+    counters = [0] * len(_LEVELS)
+    lines = []
+    for header in headers:
+        if header.command not in _LEVELS:
+            continue
+        depth = _LEVELS.index(header.command)
+        if not chapters and header.command == "chapter":
+            continue
+        counters[depth] += 1
+        if depth > 0:
+            # A part restarts no counter, any other level those below it
+            counters[depth + 1:] = [0] * (len(_LEVELS) - depth - 1)
+        if depth == 0:
+            number = _roman(counters[0])
+            anchor = f"part.{counters[0]}"
+        else:
+            number = ".".join(str(counter) for counter in counters[first:depth + 1])
+            anchor = f"{header.command}.{number}"
+        # LaTeX levels go from -1 (part) to 5 (subparagraph)
+        numbered = depth - 1 <= secnumdepth
+        key = (header.command, number if numbered else header.title)
+        entry = f"\\numberline {{{number}}}{header.title}" if numbered else header.title
+        line = f"\\contentsline {{{header.command}}}{{{entry}}}{{{pages.get(key, '')}}}"
+        if hyperref:
+            line += f"{{{anchor}}}"
+        lines.append(line + "%\n")
+    return "".join(lines)
+
+def read_toc_pages(path: Path) -> dict[tuple[str, str], str]:
+    """Return the page numbers of the entries of the ``.toc`` file ``path``,
+    written by a previous engine run, by (level, number), or (level, title)
+    for unnumbered entries.
+    """
+    pages = {}
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                match_ = _CONTENTSLINE.match(line.strip())
+                if match_ is not None:
+                    command, number, title, page = match_.groups()
+                    pages[(command, number if number is not None else title)] = page
+    except FileNotFoundError:
+        pass
+    return pages
@@ -0,0 +1,124 @@
+"""Syntax highlighting of code blocks with Pygments, in-process.
+
+Pygments is optional: without it, code blocks are left as plain verbatim.
+A highlighted block is stored in ``highlight_cache`` (in ``config.yaml``)
+under the hash of its language, style, code and Pygments version, so the
+code of unchanged blocks is never highlighted twice, across runs and
+documents.
+"""
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from importlib import import_module
+from pathlib import Path
+from typing import Iterable, Optional
+from warnings import warn
+
+from mdtk.config import config
+from .files import write_text
+
+__all__ = [
+    "validate_style",
+    "style_definitions",
+    "highlight_blocks",
+]
+
+# Below this number of blocks to highlight, starting worker processes
+# costs more than it saves
+_PARALLEL_MIN_BLOCKS = 16
+
+
+@lru_cache(maxsize=1)
+def _pygments():
+    try:
+        return import_module("pygments")
+    except ImportError:
+        warn("Pygments is not installed: code blocks are not highlighted.")
+        return None
+
+def validate_style(style: str):
+    """Raise a ValueError if ``style`` is not a Pygments style."""
+    pygments = _pygments()
+    if pygments is None:
+        return
+    styles = import_module("pygments.styles")
+    if style not in styles.get_all_styles():
+        raise ValueError(
+            f"Unknown highlighting style '{style}'. "
+            f"Choose among: {', '.join(sorted(styles.get_all_styles()))}."
+        )
+
+@lru_cache(maxsize=8)
+def style_definitions(style: str) -> str:
+    """Return the LaTeX definitions of the commands of highlighted code."""
+    formatters = import_module("pygments.formatters")
+    return formatters.LatexFormatter(style=style).get_style_defs() + "\n"
+
+def _cache_path(language: str, code: str, style: str) -> Optional[Path]:
+    if not config.highlight_cache:
+        return None
+    key = "\0".join((language, style, _pygments().__version__, code))
+    return Path(config.highlight_cache).expanduser() / f"{hashlib.sha256(key.encode()).hexdigest()}.tex"
+
+def _highlight(block: tuple[str, str], style: str) -> Optional[str]:
+    language, code = block
+    lexers = import_module("pygments.lexers")
+    util = import_module("pygments.util")
+    try:
+        lexer = lexers.get_lexer_by_name(language)
+    except util.ClassNotFound:
+        return None
+    formatters = import_module("pygments.formatters")
+    return _pygments().highlight(code, lexer, formatters.LatexFormatter(style=style, nowrap=True))
+
+def _read_cache(path: Optional[Path]):
+    if path is None:
+        return None
+    try:
+        return path.read_text(encoding="utf-8")
+    except OSError:
+        return None
+
+def highlight_blocks(blocks: Iterable[tuple[str, str]], style: str, max_workers: int = 1):
+    """Return the highlighted code of the ``(language, code)`` blocks, as
+    the content of a ``Verbatim`` environment with ``commandchars=\\\\\\{\\}``,
+    by block. Blocks whose language Pygments does not know are left out.
+
+    Blocks missing from the cache are highlighted in ``max_workers``
+    processes, if there are enough of them.
+    """
+    if _pygments() is None:
+        return {}
+    blocks = list(dict.fromkeys(blocks))
+    paths = [_cache_path(language, code, style) for language, code in blocks]
+    highlighted = {}
+    missing = []
+    for block, path in zip(blocks, paths):
+        latex = _read_cache(path)
+        if latex is None:
+            missing.append((block, path))
+        elif latex:
+            highlighted[block] = latex
+    if not missing:
+        return highlighted
+    to_highlight = [block for block, _ in missing]
+    if max_workers > 1 and len(missing) >= _PARALLEL_MIN_BLOCKS:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(
+                _highlight, to_highlight, [style] * len(missing),
+                chunksize=max(1, len(missing) // (4 * max_workers)),
+            ))
+    else:
+        results = [_highlight(block, style) for block in to_highlight]
+    cache = True
+    for (block, path), latex in zip(missing, results):
+        if path is not None and cache:
+            # Blocks in an unknown language are cached as empty
+            try:
+                write_text(path, latex or "")
+            except OSError as exc:
+                warn(f"Highlighted code cannot be cached in '{path.parent}': {exc}")
+                cache = False
+        if latex:
+            highlighted[block] = latex
+    return highlighted
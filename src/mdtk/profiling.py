@@ -0,0 +1,91 @@
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+
+from mdtk._exceptions import MemoryLimitError
+
+__all__ = [
+    "MemoryProfiler",
+]
+
+
+class MemoryProfiler:
+    """Record the peak memory of each conversion stage with ``tracemalloc``.
+
+    If ``max_memory`` (in bytes) is passed, ``MemoryLimitError`` is raised
+    when a stage finishes above it, or earlier, when ``check`` finds the
+    memory above it: the parser checks between its stages and in the long
+    loops of the stages. Stages may be nested: the peak of an inner stage
+    also counts for the stages that enclose it.
+    A disabled profiler does nothing, so it can always be passed around.
+    """
+
+    def __init__(self, max_memory: Optional[int] = None, enabled: bool = False):
+        self.max_memory = max_memory
+        self.enabled = enabled or max_memory is not None
+        self.peaks = {}
+        self._stack = []
+        # Names of the stages running, the innermost last
+        self._names = []
+        self._started = False
+
+    @classmethod
+    def from_app(cls, app):
+        max_memory = app.max_memory * 2**20 if app.max_memory is not None else None
+        return cls(max_memory=max_memory, enabled=app.profile_memory)
+
+    def __enter__(self):
+        if self.enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started = True
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._started:
+            tracemalloc.stop()
+            self._started = False
+
+    def _fold_peak(self):
+        if self._stack:
+            self._stack[-1] = max(self._stack[-1], tracemalloc.get_traced_memory()[1])
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled or not tracemalloc.is_tracing():
+            yield
+            return
+        self._fold_peak()
+        self._stack.append(0)
+        self._names.append(name)
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            self._names.pop()
+            peak = max(self._stack.pop(), tracemalloc.get_traced_memory()[1])
+            self.peaks[name] = max(self.peaks.get(name, 0), peak)
+            if self._stack:
+                self._stack[-1] = max(self._stack[-1], peak)
+        if self.max_memory is not None and peak > self.max_memory:
+            raise MemoryLimitError(name, peak, self.max_memory)
+
+    def check(self):
+        """Raise ``MemoryLimitError`` if the memory traced now is above
+        ``max_memory``, without waiting for the stage to end.
+        """
+        if self.max_memory is None or not tracemalloc.is_tracing():
+            return
+        current = tracemalloc.get_traced_memory()[0]
+        if current > self.max_memory:
+            stage = self._names[-1] if self._names else "conversion"
+            raise MemoryLimitError(stage, current, self.max_memory)
+
+    def report(self, input_size: Optional[int] = None) -> str:
+        width = max((len(name) for name in self.peaks), default=0)
+        lines = ["Peak memory per stage:"]
+        for name, peak in self.peaks.items():
+            line = f"  {name:<{width}}  {peak / 2**20:10.2f} MiB"
+            if input_size:
+                line += f"  ({peak / input_size:.1f}x input)"
+            lines.append(line)
+        return "\n".join(lines)
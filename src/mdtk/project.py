@@ -0,0 +1,193 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from importlib import metadata
+from pathlib import Path, PurePosixPath
+from typing import Callable
+
+from mdtk import _expressions as xpr
+from .app import App
+from .assets import AssetPipeline
+from .config import ResolvedConfig
+from .convert import MarkdownParser
+from .files import read_markdown, write_text
+from .headers import ProjectLabels, lower_headers
+from .scheduling import BatchProgress, TimingHistory, estimate_cost, longest_first
+
+__all__ = [
+    "IncludeGraph",
+    "convert_chapters",
+]
+
+
+class IncludeGraph:
+    """Chapters included by a main Markdown document with
+    ``[//]: <> (%include chapter.md)``.
+
+    Include paths are relative to the main document. LaTeX cannot nest
+    ``\\include``, so chapters may not include other files.
+    """
+
+    def __init__(self, root: Path, text: str | None = None):
+        self.root = Path(root)
+        if text is None:
+            text = read_markdown(self.root)
+        self.chapters = list(dict.fromkeys(
+            PurePosixPath(match_.groups()[0]) for match_ in xpr.include.finditer(text)
+        ))
+        for chapter in self.chapters:
+            source = self.source(chapter)
+            if not source.exists():
+                raise FileNotFoundError(
+                    f"File {source} (included from {self.root}) not found."
+                )
+            nested = xpr.include.search(read_markdown(source))
+            if nested is not None:
+                raise ValueError(
+                    f"Chapter {source} includes '{nested.groups()[0]}', "
+                    "but includes cannot be nested."
+                )
+
+    def __bool__(self):
+        return bool(self.chapters)
+
+    def __iter__(self):
+        return iter(self.chapters)
+
+    def dependencies(self):
+        """Yield the chapter files, and the local images they reference."""
+        for chapter in self.chapters:
+            source = self.source(chapter)
+            yield source
+            for match_ in xpr.image.finditer(read_markdown(source)):
+                image = source.parent / match_.groups()[1]
+                if image.is_file():
+                    yield image
+
+    def source(self, chapter: PurePosixPath) -> Path:
+        return self.root.parent / chapter
+
+    @staticmethod
+    def target(chapter: PurePosixPath, output: Path) -> Path:
+        return output.parent / chapter.with_suffix(".tex")
+
+
+@lru_cache(maxsize=1)
+def _version():
+    try:
+        return metadata.version("Markdown-Toolkit")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+def _chapter_config(cfg: ResolvedConfig):
+    # The title is that of the main document: the `#` of a chapter is at
+    # the level of the `##` of the main document
+    if not cfg.header_one_is_title:
+        return cfg
+    return cfg.replace(header_one_is_title=False, headers=lower_headers(cfg.headers))
+
+def _stamp(cfg: ResolvedConfig):
+    # A fragment depends on the settings and on the version of mdtk, too
+    return f"{_version()} {cfg.digest()}\n"
+
+def _stamp_path(target: Path):
+    return target.with_name(target.name + ".stamp")
+
+def _is_up_to_date(source: Path, target: Path, stamp: str):
+    # A fragment with the same content keeps its mtime (see `write_text`),
+    # so the time of the conversion is that of the stamp
+    stamp_path = _stamp_path(target)
+    try:
+        return (
+            target.exists() and stamp_path.stat().st_mtime >= source.stat().st_mtime
+            and stamp_path.read_text(encoding="utf-8") == stamp
+        )
+    except OSError:
+        return False
+
+def _convert_chapter(
+    source: Path, target: Path, output_dir: Path, cfg: ResolvedConfig,
+    keep_going: bool = False, project: ProjectLabels | None = None,
+):
+    start = time.perf_counter()
+    assets = AssetPipeline(source.parent, output_dir)
+    md_parser = MarkdownParser(read_markdown(source), cfg=cfg, assets=assets,
+                               source=source, keep_going=keep_going, project=project)
+    body = md_parser.parse_body()
+    assets.run()
+    changed = write_text(target, body)
+    # Written last, so that an interrupted conversion is done again
+    stamp_path = _stamp_path(target)
+    write_text(stamp_path, _stamp(cfg))
+    os.utime(stamp_path)
+    return target, changed, md_parser.diagnostics, time.perf_counter() - start
+
+def convert_chapters(
+    app: App, graph: IncludeGraph, force: bool = False, diagnostics: list | None = None,
+    project: ProjectLabels | None = None,
+    progress: Callable[[BatchProgress], None] | None = None,
+):
+    """Convert every chapter of ``graph`` into a LaTeX fragment next to
+    ``app.output``, in parallel. Chapters whose fragment is newer than
+    their source, and was converted with the same settings and version of
+    mdtk (as recorded in the ``.stamp`` file next to it), are skipped
+    unless ``force`` is passed. The first header of a chapter is never its
+    title: the headers of chapters are one level lower than those of a
+    main document with ``header_one_is_title``.
+    Return a dict mapping the paths of the converted fragments to whether
+    they changed (fragments with the same content are not rewritten).
+    With ``app.keep_going``, the problems found in the chapters are added
+    to ``diagnostics``, if passed. Links to the headers of the files of
+    ``project`` become references.
+
+    Chapters are started longest first (see ``mdtk.scheduling``), and
+    ``progress``, if passed, is called with the progress of the batch
+    each time one is done.
+    """
+    cfg = _chapter_config(app.resolved)
+    stamp = _stamp(cfg)
+    jobs = []
+    for chapter in graph:
+        source = graph.source(chapter)
+        target = graph.target(chapter, app.output)
+        if force or not _is_up_to_date(source, target, stamp):
+            jobs.append((source, target))
+    if not jobs:
+        return {}
+    history = TimingHistory.from_config()
+    costs = [estimate_cost(source, history) for source, _ in jobs]
+    sizes = [source.stat().st_size for source, _ in jobs]
+    batch = BatchProgress(costs)
+    results = [None] * len(jobs)
+
+    def _done(i, result):
+        results[i] = result
+        history.record(jobs[i][0], sizes[i], result[3])
+        batch.update(costs[i], sizes[i])
+        if progress is not None:
+            progress(batch)
+
+    if len(jobs) == 1 or app.jobs == 1:
+        for i in longest_first(costs):
+            source, target = jobs[i]
+            _done(i, _convert_chapter(
+                source, target, app.output.parent, cfg, app.keep_going, project
+            ))
+    else:
+        with ProcessPoolExecutor(max_workers=app.jobs) as executor:
+            # Workers take the chapters in the order they are submitted
+            futures = {
+                executor.submit(
+                    _convert_chapter, jobs[i][0], jobs[i][1], app.output.parent, cfg,
+                    app.keep_going, project,
+                ): i
+                for i in longest_first(costs)
+            }
+            for future in as_completed(futures):
+                _done(futures[future], future.result())
+    history.save()
+    if diagnostics is not None:
+        for _, _, chapter_diagnostics, _ in results:
+            diagnostics.extend(chapter_diagnostics)
+    return {target: changed for target, changed, _, _ in results}
@@ -0,0 +1,117 @@
+import subprocess
+from collections import Counter
+from pathlib import Path
+
+from .app import App
+from .files import AtomicWriter, write_text
+from .headers import read_toc_pages
+
+__all__ = [
+    "Renderer",
+    "TexRenderer",
+    "PdfRenderer",
+    "check_types",
+    "render",
+]
+
+
+class Renderer:
+    """Output of the LaTeX document for one output type.
+
+    The renderers of a run share the same ``MarkdownParser``, so the
+    Markdown document is converted once, whether a .tex, a .pdf or both
+    are written.
+    """
+    type: str = ""
+    # Whether the file is compressed when the output suffix asks for it
+    compressible: bool = False
+
+    def __init__(self, app: App):
+        self.app = app
+        # Whether the last call to ``render`` modified the output file
+        self.changed = True
+
+    @property
+    def output(self) -> Path:
+        output = self.app.output.with_suffix(f".{self.type}")
+        if self.compressible and self.app.compression:
+            return output.with_name(output.name + self.app.compression)
+        return output
+
+    def render(self, md_parser, rendered: dict[str, Path]) -> Path:
+        """Write the document and return the path of the written file.
+        ``rendered`` maps the types already written in this run to their paths.
+        """
+        raise NotImplementedError
+
+
+class TexRenderer(Renderer):
+    type = "tex"
+    compressible = True
+
+    def render(self, md_parser, rendered):
+        with AtomicWriter(self.output) as writer:
+            md_parser.write_to(writer.file)
+        self.changed = writer.changed
+        return self.output
+
+
+class PdfRenderer(Renderer):
+    type = "pdf"
+
+    def render(self, md_parser, rendered):
+        # The engine reads uncompressed LaTeX, which a compressed .tex
+        # output is not
+        path_tex = self.app.output.with_suffix(".tex")
+        if rendered.get("tex") != path_tex:
+            with AtomicWriter(path_tex) as writer:
+                md_parser.write_to(writer.file)
+            if not self.app.compression:
+                rendered["tex"] = path_tex
+        if md_parser.cfg.table_of_contents:
+            # The table of contents is typeset from the .toc file written by
+            # the previous run, so a single run needs it written beforehand.
+            # Page numbers are those of the previous run, for unchanged headers
+            path_toc = path_tex.with_suffix(".toc")
+            toc = md_parser.document.toc(read_toc_pages(path_toc))
+            if toc is not None:
+                write_text(path_toc, toc)
+        # Run from the output directory, against which the paths of
+        # included chapters and images are relative
+        subprocess.run([self.app.engine, path_tex.name], cwd=path_tex.parent, check=False)
+        if "tex" not in self.app.types or self.app.compression:
+            path_tex.unlink()
+        files_to_clean = [self.output.with_suffix(ext)
+                          for ext
+                          in (".aux", ".log", ".out")
+                          ]
+        subprocess.run(["rm", "-f"] + files_to_clean, check=False)
+        return self.output
+
+
+_RENDERERS = {renderer.type: renderer for renderer in (TexRenderer, PdfRenderer)}
+
+
+def check_types(types):
+    """Raise ``NotImplementedError`` if one of ``types`` has no renderer yet."""
+    for type_ in types:
+        if type_ not in _RENDERERS:
+            raise NotImplementedError(
+                f'Output type "{type_}" is not supported yet. '
+                f'Supported types are: {", ".join(sorted(_RENDERERS))}.'
+            )
+
+def render(md_parser, app: App, writes: Counter | None = None) -> dict[str, Path]:
+    """Render the parsed document into every type in ``app.types``.
+    If passed, ``writes`` counts the output files that were ``"changed"``
+    and those left ``"unchanged"``.
+    """
+    renderers = [_RENDERERS[type_](app) for type_ in app.types]
+    rendered = {}
+    for renderer in renderers:
+        if renderer.type in rendered:
+            continue
+        rendered[renderer.type] = renderer.render(md_parser, rendered)
+        if writes is not None:
+            writes["changed" if renderer.changed else "unchanged"] += 1
+    return rendered
@@ -0,0 +1,157 @@
+"""Scheduling of the documents of a batch, such as the chapters of a
+multi-file document, on a pool of worker processes.
+
+A long document started last keeps the whole batch waiting once the
+others are done, so documents are started longest first. The conversion
+time of a document is estimated from the time it took before, scaled by
+its current size, as stored in ``timing_history`` (in ``config.yaml``);
+or else from its size and the number of costly constructs it contains.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Optional, Sequence
+from warnings import warn
+
+from mdtk.config import config
+from .files import write_text
+
+__all__ = [
+    "TimingHistory",
+    "estimate_cost",
+    "longest_first",
+    "BatchProgress",
+]
+
+# Conversion time of a byte of Markdown, in seconds, before any is measured
+_SECONDS_PER_BYTE = 2e-6
+# Extra cost of the constructs that take the most time to convert, in bytes
+# of plain text, by the string that marks them
+_CONSTRUCT_COSTS = {
+    b"```": 2000,
+    b"%texenv": 500,
+    b"](": 200,
+    b"|": 20,
+}
+# Documents kept in the history, the most recently converted ones
+_MAX_TIMINGS = 4096
+
+
+class TimingHistory:
+    """Conversion times of documents, by absolute path, as (size in bytes,
+    seconds), stored as JSON in ``path``. Without ``path``, times are only
+    kept in memory.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = Path(path).expanduser() if path else None
+        self.timings = {}
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.timings = {
+                    key: (int(size), float(seconds))
+                    for key, (size, seconds) in json.load(f).items()
+                }
+        except (OSError, ValueError, TypeError, AttributeError):
+            # Missing or corrupt: timings are measured again
+            self.timings = {}
+
+    @classmethod
+    def from_config(cls):
+        return cls(config.timing_history)
+
+    def seconds_per_byte(self) -> float:
+        """Return the mean conversion time of a byte over the history."""
+        size = sum(size for size, _ in self.timings.values())
+        if not size:
+            return _SECONDS_PER_BYTE
+        return sum(seconds for _, seconds in self.timings.values()) / size
+
+    def estimate(self, path: Path, size: int) -> Optional[float]:
+        """Return the conversion time of ``path``, now ``size`` bytes long,
+        from its last one, or None if it was never converted.
+        """
+        timing = self.timings.get(str(Path(path).absolute()))
+        if timing is None:
+            return None
+        last_size, seconds = timing
+        return seconds * size / last_size if last_size else seconds
+
+    def record(self, path: Path, size: int, seconds: float):
+        key = str(Path(path).absolute())
+        self.timings.pop(key, None)
+        self.timings[key] = (size, seconds)
+        while len(self.timings) > _MAX_TIMINGS:
+            del self.timings[next(iter(self.timings))]
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            write_text(self.path, json.dumps(self.timings) + "\n")
+        except OSError as exc:
+            warn(f"Conversion times cannot be saved in '{self.path}': {exc}")
+
+
+def estimate_cost(path: Path, history: Optional[TimingHistory] = None) -> float:
+    """Return the estimated conversion time of the Markdown file ``path``,
+    in seconds.
+    """
+    history = history or TimingHistory()
+    size = Path(path).stat().st_size
+    seconds = history.estimate(path, size)
+    if seconds is not None:
+        return seconds
+    # Counted in the raw bytes, which is much cheaper than parsing them
+    with open(path, "rb") as f:
+        data = f.read()
+    weighted = len(data) + sum(cost * data.count(mark) for mark, cost in _CONSTRUCT_COSTS.items())
+    return weighted * history.seconds_per_byte()
+
+def longest_first(costs: Sequence[float]) -> list[int]:
+    """Return the indices of ``costs``, from the highest cost to the lowest."""
+    return sorted(range(len(costs)), key=lambda i: -costs[i])
+
+
+class BatchProgress:
+    """Progress of a batch of documents of estimated ``costs`` (in
+    seconds). Printed, it gives the documents done, the throughput, and
+    the estimated time left.
+    """
+
+    def __init__(self, costs: Sequence[float]):
+        self.total = len(costs)
+        self.total_cost = sum(costs)
+        self.done = 0
+        self.done_cost = 0.0
+        self.done_size = 0
+        self._start = time.perf_counter()
+
+    def update(self, cost: float, size: int):
+        """Count a finished document."""
+        self.done += 1
+        self.done_cost += cost
+        self.done_size += size
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._start
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds left, at the pace of the documents done so far."""
+        if not self.done_cost:
+            return None
+        return self.elapsed * max(self.total_cost - self.done_cost, 0.0) / self.done_cost
+
+    def __str__(self):
+        elapsed = max(self.elapsed, 1e-9)
+        text = (
+            f"{self.done}/{self.total} documents, {self.done / elapsed:.1f} docs/s, "
+            f"{self.done_size / 2**20 / elapsed:.2f} MB/s"
+        )
+        if self.done < self.total and self.eta is not None:
+            text += f", ETA {self.eta:.1f} s"
+        return text
@@ -0,0 +1,122 @@
+from bisect import bisect_right
+
+from mdtk import _expressions as xpr
+from .config import config
+
+__all__ = [
+    "safe_boundaries",
+    "split_positions",
+    "split_markdown",
+]
+
+
+def _merge_spans(spans):
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _mask(text: str, spans):
+    # Same positions, but nothing inside the spans can match a pattern
+    chunks = []
+    end_p = 0
+    for start, end in _merge_spans(spans):
+        chunks.append(text[end_p:start])
+        chunks.append("<" + " " * (end - start - 2) + ">" if end - start >= 2 else " " * (end - start))
+        end_p = end
+    chunks.append(text[end_p:])
+    return "".join(chunks)
+
+def _texenv_spans(text: str):
+    # Pairs the begin and end lines of ``%texenv`` environments, like
+    # ``xpr.environment`` but without its backtracking
+    spans = []
+    opened = {}
+    for match_ in xpr.texenv_marker.finditer(text):
+        kind, name = match_.groups()
+        if kind == "begin":
+            opened.setdefault(name, match_.start())
+        elif name in opened:
+            spans.append((opened.pop(name), match_.end()))
+    # An environment that is never closed might still be, in the eyes of
+    # ``xpr.environment``, by a marker this function does not see
+    spans.extend((start, len(text)) for start in opened.values())
+    return spans
+
+def _unsafe_spans(text: str):
+    """Spans of the constructs a split would break: fenced code, ``%texenv``
+    regions, comments, and inline code and quotations, which may run over
+    several paragraphs.
+    """
+    spans = _texenv_spans(text)
+    for pattern in (xpr.block_code, xpr.comment, xpr.inline_code):
+        spans.extend(match_.span() for match_ in pattern.finditer(text))
+    # Quotation marks are matched with comments, code and headers shielded,
+    # as in ``MarkdownParser.quotation_marks``
+    masked = _mask(text, [
+        match_.span()
+        for pattern in (xpr.comment, xpr.block_code, xpr.headerany)
+        for match_ in pattern.finditer(text)
+    ])
+    for pattern in (xpr.double_quotations, xpr.single_quotations):
+        spans.extend(match_.span() for match_ in pattern.finditer(masked))
+    return _merge_spans(spans)
+
+def safe_boundaries(text: str):
+    """Yield the positions where ``text`` can be split into pieces that
+    convert, one by one, into the same LaTeX code as the whole text.
+
+    A safe position starts a block (it follows a blank line) that is a plain
+    paragraph, right after another plain paragraph, and is inside no
+    construct that may span several blocks.
+    """
+    unsafe = _unsafe_spans(text)
+    starts = [start for start, _ in unsafe]
+    for match_ in xpr.paragraph_break.finditer(text):
+        position = match_.end()
+        if position >= len(text) or text[position] == "\n":
+            continue
+        i = bisect_right(starts, position) - 1
+        if i >= 0 and unsafe[i][0] < position < unsafe[i][1]:
+            continue
+        last_line = text.rfind("\n", 0, match_.start()) + 1
+        if (
+            xpr.plain_line.match(text, position) is None
+            or xpr.plain_line.match(text, last_line) is None
+        ):
+            continue
+        yield position
+
+def split_positions(text: str, pieces: int):
+    """Return the positions, from 0 to the end of ``text``, where
+    ``split_markdown`` splits it.
+    """
+    pieces = min(pieces, len(text) // config.split_min_size)
+    if pieces < 2:
+        return [0, len(text)]
+    targets = iter(len(text) * i // pieces for i in range(1, pieces))
+    target = next(targets)
+    positions = [0]
+    for position in safe_boundaries(text):
+        if position < target:
+            continue
+        positions.append(position)
+        target = next(targets, None)
+        # Skip the targets this boundary went past
+        while target is not None and target <= position:
+            target = next(targets, None)
+        if target is None:
+            break
+    positions.append(len(text))
+    return positions
+
+def split_markdown(text: str, pieces: int):
+    """Split ``text`` at safe boundaries into at most ``pieces`` pieces of
+    about the same size, each at least ``split_min_size`` characters long
+    (in ``config.yaml``).
+    """
+    positions = split_positions(text, pieces)
+    return [text[start:end] for start, end in zip(positions[:-1], positions[1:])]
@@ -0,0 +1,193 @@
+"""Registry of the conversion stages of ``MarkdownParser``.
+
+A stage takes the text converted by the stages before it, and returns it
+converted. Each stage declares the stages it runs ``after`` and ``before``,
+and those it ``requires``, which it also runs after. The built-in stages
+always run in the same order; a registered stage runs right after the
+stages it runs after, or else last, unless it must run ``before`` others.
+
+A stage may also declare its ``triggers``: strings one of which must be in
+the text for the stage to change it. A stage whose triggers are not in the
+text is skipped, which costs a few substring searches instead of the
+regular expressions of the stage.
+
+Stages are registered with ``register_stage``:
+
+    @register_stage("copyright", before=("transliterate",), triggers=("(c)",))
+    def copyright_sign(md_parser, text):
+        return text.replace("(c)", "\u00a9")
+"""
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Sequence, Union
+
+__all__ = [
+    "Stage",
+    "BUILTIN_STAGES",
+    "register_stage",
+    "get_stage",
+    "stage_names",
+    "validate_stages",
+    "pipeline",
+    "is_triggered",
+]
+
+Triggers = Union[Sequence[str], Callable[[Any], Iterable[str]], None]
+
+
+class Stage(NamedTuple):
+    name: str
+    # Called as ``function(md_parser, text)``. None for the built-in stages,
+    # which are the methods of ``MarkdownParser`` of the same name
+    function: Optional[Callable[[Any, str], str]]
+    after: tuple[str, ...] = ()
+    before: tuple[str, ...] = ()
+    requires: tuple[str, ...] = ()
+    # Strings, or a function of the parser returning them; None if the
+    # stage always runs
+    triggers: Triggers = None
+
+
+def _escape_triggers(md_parser):
+    return (*md_parser.escape_characters, "\\LaTeX")
+
+def _ligature_triggers(md_parser):
+    return md_parser.cfg.break_ligatures
+
+# Built-in stages, in order: each runs after the one before it. The order
+# matters, e.g. the backticks of inline code are not quotation marks, and
+# `[alt](path)` is a link once the image is taken out
+_BUILTIN = (
+    Stage("escape", None, triggers=_escape_triggers),
+    Stage("sections", None, triggers=("#",)),
+    Stage("labels", None, requires=("sections",), triggers=("\\",)),
+    Stage("inline_code", None, triggers=("`",)),
+    Stage("tables", None, triggers=("|",)),
+    Stage("environments", None, triggers=("%texenv",)),
+    Stage("images", None, triggers=("![",)),
+    Stage("references", None, triggers=("](",)),
+    Stage("href", None, triggers=("](",)),
+    Stage("enumerate", None, triggers=("-", "*", "+", ".")),
+    Stage("emph", None, triggers=("*", "_")),
+    Stage("quotation_marks", None, triggers=("'", '"')),
+    # Also transliterates the title, author and date, so it always runs
+    Stage("transliterate", None),
+    Stage("comments", None, triggers=("[//]:",)),
+    Stage("block_code", None, triggers=("```",)),
+    Stage("block_quotes", None, triggers=("\n>",)),
+    Stage("break_ligatures", None, triggers=_ligature_triggers),
+)
+_BUILTIN = tuple(
+    stage._replace(after=(_BUILTIN[i - 1].name,)) if i else stage
+    for i, stage in enumerate(_BUILTIN)
+)
+# Names of the built-in stages, in their default order
+BUILTIN_STAGES = tuple(stage.name for stage in _BUILTIN)
+
+_STAGES = {stage.name: stage for stage in _BUILTIN}
+
+
+def register_stage(
+    name: str,
+    after: Iterable[str] = (),
+    before: Iterable[str] = (),
+    requires: Iterable[str] = (),
+    triggers: Triggers = None,
+):
+    """Return a decorator registering a function ``(md_parser, text) -> text``
+    as the stage ``name``. Registering a built-in stage again replaces it,
+    at its place in the pipeline.
+    """
+    builtin = dict(zip(BUILTIN_STAGES, _BUILTIN)).get(name)
+    if builtin is not None:
+        after = (*builtin.after, *after)
+
+    def decorator(function):
+        _STAGES[name] = Stage(
+            name, function, tuple(after), tuple(before), tuple(requires),
+            tuple(triggers) if isinstance(triggers, (list, tuple)) else triggers,
+        )
+        return function
+    return decorator
+
+def get_stage(name: str) -> Stage:
+    if name not in _STAGES:
+        raise ValueError(
+            f'Unknown stage "{name}". Registered stages are: {", ".join(_STAGES)}.'
+        )
+    return _STAGES[name]
+
+def stage_names() -> tuple[str, ...]:
+    """Return the names of every registered stage, in pipeline order."""
+    return tuple(stage.name for stage in _ordered())
+
+def validate_stages(names: Iterable[str]):
+    """Raise a ValueError if one of ``names`` is not a registered stage."""
+    for name in names:
+        get_stage(name)
+
+def _ordered() -> list[Stage]:
+    stages = list(_STAGES.values())
+    position = {stage.name: i for i, stage in enumerate(stages)}
+    # Stages each stage must run after
+    predecessors = {stage.name: set() for stage in stages}
+    for stage in stages:
+        for name in (*stage.after, *stage.requires):
+            get_stage(name)
+            predecessors[stage.name].add(name)
+        for name in stage.before:
+            get_stage(name)
+            predecessors[name].add(stage.name)
+
+    def _priority(stage):
+        # Registered stages run as soon as the stages they run after have,
+        # the others in the order of registration
+        constrained = stage.name not in BUILTIN_STAGES and bool(predecessors[stage.name])
+        return (not constrained, position[stage.name])
+
+    ordered = []
+    done = set()
+    while len(ordered) < len(stages):
+        ready = min(
+            (stage for stage in stages
+             if stage.name not in done and predecessors[stage.name] <= done),
+            key=_priority, default=None,
+        )
+        if ready is None:
+            cycle = sorted(set(position) - done, key=position.get)
+            raise ValueError(f"The order of the stages {', '.join(cycle)} is circular.")
+        ordered.append(ready)
+        done.add(ready.name)
+    return ordered
+
+def pipeline(stages: Optional[Iterable[str]] = None, skip: Iterable[str] = ()) -> tuple[Stage, ...]:
+    """Return the stages to run, in order: ``stages`` (every registered
+    stage if None) and the stages they require, without ``skip`` and the
+    stages requiring them.
+    """
+    ordered = _ordered()
+    if stages is None:
+        selected = {stage.name for stage in ordered}
+    else:
+        selected = set()
+        pending = list(stages)
+        while pending:
+            name = pending.pop()
+            if name not in selected:
+                selected.add(name)
+                pending.extend(get_stage(name).requires)
+    skipped = set(skip)
+    validate_stages(skipped)
+    for stage in ordered:
+        if skipped.intersection(stage.requires):
+            skipped.add(stage.name)
+    return tuple(
+        stage for stage in ordered if stage.name in selected and stage.name not in skipped
+    )
+
+def is_triggered(stage: Stage, md_parser, text: str) -> bool:
+    """Return whether ``stage`` may change ``text``, from its triggers."""
+    triggers = stage.triggers
+    if triggers is None:
+        return True
+    if callable(triggers):
+        triggers = triggers(md_parser)
+    return any(trigger in text for trigger in triggers)
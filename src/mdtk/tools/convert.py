@@ -1,33 +1,153 @@
 #pylint: disable=E0203,E1101
 
+import os
 import sys
 import subprocess
+from collections import Counter
 
 from mdtk import App, MarkdownParser
+from mdtk._exceptions import MemoryLimitError
+from mdtk.assets import AssetPipeline
+from mdtk.depfile import DATA_DEPENDENCIES, project_dependencies, write_depfile
+from mdtk.diagnostics import Diagnostic, write_report
+from mdtk.environment import render_cache_info
+from mdtk.files import read_markdown
+from mdtk.headers import ProjectLabels
+from mdtk.profiling import MemoryProfiler
+from mdtk.project import IncludeGraph, convert_chapters
+from mdtk.renderers import check_types, render
+
+def _report_cache(app: App):
+    if not app.verbose:
+        return
+    info = render_cache_info()
+    print(
+        f"Environment cache: {info.hits} hits, {info.misses} misses "
+        f"({info.currsize}/{info.maxsize} entries)",
+        file=sys.stderr,
+    )
+
+def _report_progress(batch):
+    print(f"Chapters: {batch}", file=sys.stderr)
+
+def _report_diagnostics(app: App, diagnostics):
+    for diagnostic in diagnostics:
+        print(diagnostic, file=sys.stderr)
+    if app.report is not None:
+        write_report(app.report, diagnostics, app.input)
+    return 1 if any(diagnostic.severity == "error" for diagnostic in diagnostics) else 0
+
+def _include_graph(app: App, text: str, diagnostics):
+    try:
+        return IncludeGraph(app.input, text=text)
+    except (OSError, ValueError) as exc:
+        if not app.keep_going:
+            raise
+        # The chapters are left out, their \include stays in the document
+        diagnostics.append(Diagnostic(str(app.input), None, "chapters", str(exc)))
+        return IncludeGraph(app.input, text="")
+
+def convert(app: App):
+    try:
+        check_types(app.types)
+    except NotImplementedError as exc:
+        # Nothing is converted for a type that cannot be written
+        print(exc, file=sys.stderr)
+        return 1
+    writes = Counter()
+    diagnostics = []
+    with MemoryProfiler.from_app(app) as profiler:
+        try:
+            assets = AssetPipeline(app.input.parent, app.output.parent)
+            with profiler.stage("read"):
+                try:
+                    markdown = read_markdown(app.input)
+                except (OSError, UnicodeDecodeError) as exc:
+                    if not app.keep_going:
+                        raise
+                    # Nothing can be converted
+                    _report_diagnostics(app, [Diagnostic(str(app.input), None, "read", str(exc))])
+                    return 1
+                md_parser = MarkdownParser(
+                    markdown, cfg=app, profiler=profiler, assets=assets,
+                    jobs=(app.jobs or os.cpu_count()) if app.split else 1,
+                    source=app.input, keep_going=app.keep_going,
+                )
+                # Only the parser keeps the Markdown, and releases it once parsed
+                del markdown
+            chapter_diagnostics = []
+            with profiler.stage("chapters"):
+                graph = _include_graph(app, md_parser.markdown, chapter_diagnostics)
+                # Links between the files of the project resolve to their headers
+                md_parser.project = ProjectLabels(
+                    app.input, map(graph.source, graph), app.header_one_is_title,
+                )
+                if graph:
+                    converted = convert_chapters(
+                        app, graph, force=app.force, diagnostics=chapter_diagnostics,
+                        project=md_parser.project,
+                        progress=_report_progress if app.verbose else None,
+                    )
+                    writes.update(
+                        "changed" if changed else "unchanged" for changed in converted.values()
+                    )
+                    if app.verbose:
+                        print(
+                            f"Chapters: {len(converted)} converted, "
+                            f"{len(graph.chapters) - len(converted)} up to date",
+                            file=sys.stderr,
+                        )
+            with profiler.stage("parse"):
+                md_parser.document # pylint: disable=W0104
+            diagnostics = md_parser.diagnostics + chapter_diagnostics
+            with profiler.stage("assets"):
+                converted = assets.run(max_workers=app.jobs)
+                if app.verbose and (converted or assets.failed):
+                    print(
+                        f"Images: {converted} converted, {len(assets.failed)} failed",
+                        file=sys.stderr,
+                    )
+            with profiler.stage("render"):
+                rendered = render(md_parser, app, writes)
+            if app.depfile is not None:
+                write_depfile(
+                    app.depfile,
+                    targets=[
+                        *(rendered[type_] for type_ in app.types),
+                        *(graph.target(chapter, app.output) for chapter in graph),
+                    ],
+                    prerequisites=[
+                        app.input,
+                        *graph.dependencies(),
+                        *assets.sources,
+                        *project_dependencies(app.input),
+                        *DATA_DEPENDENCIES,
+                    ],
+                )
+        except MemoryLimitError as exc:
+            print(exc, file=sys.stderr)
+            return 1
+    if app.profile_memory:
+        print(profiler.report(input_size=app.input.stat().st_size), file=sys.stderr)
+    _report_cache(app)
+    if app.verbose:
+        print(
+            f"Files: {writes['changed']} written, {writes['unchanged']} unchanged",
+            file=sys.stderr,
+        )
+    status = _report_diagnostics(app, diagnostics) if app.keep_going else 0
+    if "pdf" in rendered:
+        subprocess.run(["evince", rendered["pdf"]], check=False)
+    return status
 
 def md2tex(app: App):
-    with open(app.input, "r", encoding="utf-8") as f:
-        md_parser = MarkdownParser(f.read(), cfg=app)
-    with open(app.output, "w", encoding="utf-8") as f:
-        f.write(md_parser.latex)
-    return 0
+    app.types = ("tex",)
+    return convert(app)
 
 def md2pdf(app: App):
-    md2tex(app)
-    output = app.output
-    subprocess.run(["pdflatex", app.output], check=False)
-    files_to_clean = [output.parent / (output.stem + ext)
-                      for ext
-                      in (".aux", ".log", ".out", ".toc")
-                      ]
-    subprocess.run(["rm"] + files_to_clean, check=False)
-    subprocess.run(["evince", output.parent / (output.stem + ".pdf")], check=False)
-    return 0
+    app.types = ("pdf",)
+    return convert(app)
     
 def mdtk():
     app = App(sys.argv[1:])
-    if app.type == "tex":
-        return md2tex(app)
-    if app.type == "pdf":
-        return md2pdf(app)
-    return 1
\ No newline at end of file
+    return convert(app)
@@ -0,0 +1,193 @@
+"""Transliteration of Unicode characters that pdflatex cannot typeset
+(Greek letters, arrows, mathematical symbols, typographic punctuation,
+letters with diacritics, ...) into LaTeX commands.
+
+The code-point table is computed once per process, on first use, and
+applied with ``str.translate``, in a single pass over the text.
+"""
+import unicodedata
+from functools import lru_cache
+
+__all__ = [
+    "ENGINES",
+    "translation_table",
+    "transliterate",
+]
+
+# TeX engines, and whether they need transliteration. Those reading
+# Unicode natively get the text unchanged
+ENGINES = {
+    "pdflatex": True,
+    "xelatex": False,
+    "lualatex": False,
+}
+
+_GREEK = {
+    "alpha": "\\alpha", "beta": "\\beta", "gamma": "\\gamma", "delta": "\\delta",
+    "epsilon": "\\varepsilon", "zeta": "\\zeta", "eta": "\\eta", "theta": "\\theta",
+    "iota": "\\iota", "kappa": "\\kappa", "lamda": "\\lambda", "mu": "\\mu",
+    "nu": "\\nu", "xi": "\\xi", "omicron": "o", "pi": "\\pi", "rho": "\\rho",
+    "final sigma": "\\varsigma", "sigma": "\\sigma", "tau": "\\tau",
+    "upsilon": "\\upsilon", "phi": "\\varphi", "chi": "\\chi", "psi": "\\psi",
+    "omega": "\\omega",
+}
+_GREEK_CAPITALS = {
+    "gamma": "\\Gamma", "delta": "\\Delta", "theta": "\\Theta", "lamda": "\\Lambda",
+    "xi": "\\Xi", "pi": "\\Pi", "sigma": "\\Sigma", "upsilon": "\\Upsilon",
+    "phi": "\\Phi", "psi": "\\Psi", "omega": "\\Omega",
+    # Capitals without a command of their own look like Latin letters
+    "alpha": "A", "beta": "B", "epsilon": "E", "zeta": "Z", "eta": "H",
+    "iota": "I", "kappa": "K", "mu": "M", "nu": "N", "omicron": "O",
+    "rho": "P", "tau": "T", "chi": "X",
+}
+
+# Characters typeset in math mode
+_MATH = {
+    "ϑ": "\\vartheta", "ϕ": "\\phi", "ϖ": "\\varpi", "ϱ": "\\varrho",
+    "ϵ": "\\epsilon",
+    # Arrows
+    "←": "\\leftarrow", "↑": "\\uparrow", "→": "\\rightarrow",
+    "↓": "\\downarrow", "↔": "\\leftrightarrow", "↕": "\\updownarrow",
+    "↖": "\\nwarrow", "↗": "\\nearrow", "↘": "\\searrow", "↙": "\\swarrow",
+    "↦": "\\mapsto", "↩": "\\hookleftarrow", "↪": "\\hookrightarrow",
+    "↼": "\\leftharpoonup", "↽": "\\leftharpoondown",
+    "⇀": "\\rightharpoonup", "⇁": "\\rightharpoondown",
+    "⇌": "\\rightleftharpoons", "⇐": "\\Leftarrow", "⇑": "\\Uparrow",
+    "⇒": "\\Rightarrow", "⇓": "\\Downarrow", "⇔": "\\Leftrightarrow",
+    "⇕": "\\Updownarrow", "⟵": "\\longleftarrow", "⟶": "\\longrightarrow",
+    "⟷": "\\longleftrightarrow", "⟸": "\\Longleftarrow",
+    "⟹": "\\Longrightarrow", "⟺": "\\Longleftrightarrow", "⟼": "\\longmapsto",
+    # Mathematical operators
+    "∀": "\\forall", "∂": "\\partial", "∃": "\\exists", "∅": "\\emptyset",
+    "∇": "\\nabla", "∈": "\\in", "∉": "\\notin", "∋": "\\ni",
+    "∏": "\\prod", "∐": "\\coprod", "∑": "\\sum", "−": "-",
+    "∓": "\\mp", "∕": "/", "∖": "\\setminus", "∗": "\\ast",
+    "∘": "\\circ", "∙": "\\bullet", "√": "\\surd", "∝": "\\propto",
+    "∞": "\\infty", "∠": "\\angle", "∣": "\\mid", "∥": "\\parallel",
+    "∧": "\\wedge", "∨": "\\vee", "∩": "\\cap", "∪": "\\cup",
+    "∫": "\\int", "∮": "\\oint", "∼": "\\sim", "≃": "\\simeq",
+    "≅": "\\cong", "≈": "\\approx", "≍": "\\asymp", "≐": "\\doteq",
+    "≠": "\\neq", "≡": "\\equiv", "≤": "\\leq", "≥": "\\geq",
+    "≪": "\\ll", "≫": "\\gg", "⊂": "\\subset", "⊃": "\\supset",
+    "⊆": "\\subseteq", "⊇": "\\supseteq", "⊎": "\\uplus",
+    "⊑": "\\sqsubseteq", "⊒": "\\sqsupseteq", "⊓": "\\sqcap",
+    "⊔": "\\sqcup", "⊕": "\\oplus", "⊖": "\\ominus", "⊗": "\\otimes",
+    "⊘": "\\oslash", "⊙": "\\odot", "⊢": "\\vdash", "⊣": "\\dashv",
+    "⊤": "\\top", "⊥": "\\perp", "⊨": "\\models", "⋀": "\\bigwedge",
+    "⋁": "\\bigvee", "⋂": "\\bigcap", "⋃": "\\bigcup", "⋄": "\\diamond",
+    "⋅": "\\cdot", "⋆": "\\star", "⋮": "\\vdots", "⋯": "\\cdots",
+    "⋱": "\\ddots", "⌈": "\\lceil", "⌉": "\\rceil", "⌊": "\\lfloor",
+    "⌋": "\\rfloor", "⟨": "\\langle", "⟩": "\\rangle",
+    "¬": "\\neg", "±": "\\pm", "×": "\\times", "÷": "\\div",
+    "µ": "\\mu", "′": "\\prime", "″": "\\prime\\prime",
+    "ℵ": "\\aleph", "ℓ": "\\ell", "℘": "\\wp", "ℜ": "\\Re",
+    "ℑ": "\\Im",
+    "♠": "\\spadesuit", "♡": "\\heartsuit", "♢": "\\diamondsuit",
+    "♣": "\\clubsuit", "♭": "\\flat", "♮": "\\natural", "♯": "\\sharp",
+}
+
+# Characters typeset in text mode
+_TEXT = {
+    "\u00a0": "~", "¡": "\\textexclamdown{}", "£": "\\pounds{}",
+    "§": "\\S{}", "©": "\\copyright{}", "ª": "\\textordfeminine{}",
+    "\u00ad": "\\-", "®": "\\textregistered{}", "°": "\\textdegree{}",
+    "²": "\\textsuperscript{2}", "³": "\\textsuperscript{3}", "¶": "\\P{}",
+    "·": "\\textperiodcentered{}", "¹": "\\textsuperscript{1}",
+    "º": "\\textordmasculine{}", "¼": "\\textonequarter{}",
+    "½": "\\textonehalf{}", "¾": "\\textthreequarters{}",
+    "¿": "\\textquestiondown{}", "Æ": "\\AE{}", "Ø": "\\O{}",
+    "ß": "\\ss{}", "æ": "\\ae{}", "ø": "\\o{}", "ı": "\\i{}",
+    "Ł": "\\L{}", "ł": "\\l{}", "Œ": "\\OE{}", "œ": "\\oe{}",
+    "ȷ": "\\j{}",
+    # Spaces
+    "\u2002": "\\enspace{}", "\u2003": "\\quad{}", "\u2009": "\\,",
+    "\u200a": "\\,", "\u200b": "\\hspace{0pt}", "\u202f": "\\,",
+    # Punctuation
+    "\u2010": "-", "\u2011": "-", "‒": "\\textendash{}", "–": "\\textendash{}",
+    "—": "\\textemdash{}", "―": "\\textemdash{}", "‖": "\\textbardbl{}",
+    "‘": "\\textquoteleft{}", "’": "\\textquoteright{}",
+    "“": "\\textquotedblleft{}", "”": "\\textquotedblright{}",
+    "†": "\\dag{}", "‡": "\\ddag{}", "•": "\\textbullet{}", "…": "\\dots{}",
+    "‰": "\\textperthousand{}", "⁄": "\\textfractionsolidus{}",
+    "€": "\\texteuro{}", "™": "\\texttrademark{}", "№": "\\textnumero{}",
+    "℃": "\\textcelsius{}", "\u2126": "\\textohm{}", "○": "\\textopenbullet{}",
+}
+
+# Combining marks, and the LaTeX accents they stand for
+_ACCENTS = {
+    "\u0300": "\\`", "\u0301": "\\'", "\u0302": "\\^", "\u0303": "\\~",
+    "\u0304": "\\=", "\u0306": "\\u", "\u0307": "\\.", "\u0308": '\\"',
+    "\u030a": "\\r", "\u030b": "\\H", "\u030c": "\\v", "\u0323": "\\d",
+    "\u0327": "\\c", "\u0328": "\\k", "\u0331": "\\b",
+}
+# Marks placed above the letter, over which i and j lose their dot
+_ACCENTS_ABOVE = set("\u0300\u0301\u0302\u0303\u0304\u0306\u0307\u0308\u030a\u030b\u030c")
+
+# Blocks with letters with diacritics: Latin-1 Supplement to Latin
+# Extended-B, and Latin Extended Additional
+_ACCENTED_RANGES = (range(0x00c0, 0x0250), range(0x1e00, 0x1f00))
+
+
+def _greek():
+    for code in range(0x0391, 0x03ca):
+        try:
+            name = unicodedata.name(chr(code))
+        except ValueError:
+            continue
+        # e.g. GREEK SMALL LETTER FINAL SIGMA
+        _, case, _, letter = name.split(" ", 3)
+        letters = _GREEK if case == "SMALL" else _GREEK_CAPITALS
+        if letter.lower() in letters:
+            yield chr(code), letters[letter.lower()]
+
+def _accented(char: str):
+    decomposition = unicodedata.normalize("NFD", char)
+    base, marks = decomposition[0], decomposition[1:]
+    if not marks or not base.isascii() or not base.isalpha():
+        return None
+    if any(mark not in _ACCENTS for mark in marks):
+        return None
+    latex = base
+    for mark in marks:
+        if latex in ("i", "j") and mark in _ACCENTS_ABOVE:
+            latex = f"\\{latex}"
+        latex = f"{_ACCENTS[mark]}{{{latex}}}"
+    return latex
+
+@lru_cache(maxsize=1)
+def _table():
+    table = {}
+    for ranges in _ACCENTED_RANGES:
+        for code in ranges:
+            latex = _accented(chr(code))
+            if latex is not None:
+                table[code] = latex
+    for char, latex in _greek():
+        table[ord(char)] = f"\\ensuremath{{{latex}}}" if latex.startswith("\\") else latex
+    for char, latex in _MATH.items():
+        table[ord(char)] = f"\\ensuremath{{{latex}}}"
+    for char, latex in _TEXT.items():
+        table[ord(char)] = latex
+    # Ligatures, and fullwidth digits and letters
+    for code in (
+        *range(0xfb00, 0xfb07), *range(0xff10, 0xff1a),
+        *range(0xff21, 0xff3b), *range(0xff41, 0xff5b),
+    ):
+        table[code] = unicodedata.normalize("NFKC", chr(code))
+    return table
+
+def translation_table(engine: str):
+    """Return the ``str.translate`` table from Unicode characters to LaTeX
+    code for ``engine``, empty if the engine reads Unicode natively.
+    """
+    if engine not in ENGINES:
+        raise ValueError(
+            f"Unknown engine '{engine}'. Choose among: {', '.join(ENGINES)}."
+        )
+    return _table() if ENGINES[engine] else {}
+
+def transliterate(text: str, engine: str = "pdflatex"):
+    table = translation_table(engine)
+    if not table or text.isascii():
+        return text
+    return text.translate(table)
@@ -0,0 +1,20 @@
+import pytest
+
+from mdtk.assets import AssetPipeline
+
+
+def test_run_counts_only_converted_images(tmp_path):
+    assets = AssetPipeline(tmp_path, tmp_path)
+    done, failed, missing = (assets.asset_dir / f"{name}.pdf" for name in ("a", "b", "c"))
+    assets.jobs = {
+        done: ["sh", "-c", f"echo pdf > {assets.asset_dir / 'a.part.pdf'}"],
+        failed: ["sh", "-c", "exit 1"],
+        # Succeeds without writing anything
+        missing: ["true"],
+    }
+    with pytest.warns(UserWarning, match="failed"):
+        assert assets.run() == 1
+    assert done.exists()
+    assert assets.failed == [failed, missing]
+    assert not failed.exists() and not missing.exists()
+    assert assets.run() == 0 and assets.failed == []
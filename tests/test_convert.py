@@ -0,0 +1,35 @@
+import pytest
+
+from mdtk import App, MarkdownParser
+from mdtk.tools.convert import convert
+
+
+def _parser(tmp_path, markdown, *args):
+    path = tmp_path / "doc.md"
+    path.write_text(markdown)
+    return MarkdownParser(markdown, cfg=App([str(path), *args]).resolved)
+
+
+def test_comments_report_the_line_of_the_command(tmp_path):
+    markdown = (
+        "Text.\n\n"
+        + "[//]: # (a comment, shorter once converted)\n\n" * 3
+        + "[//]: <> (%bogus x)\n"
+    )
+    parser = _parser(tmp_path, markdown)
+    with pytest.raises(ValueError, match=r"'%bogus' \(line 9\)"):
+        parser.comments(markdown)
+
+def test_comments_replaced_in_place(tmp_path):
+    markdown = "[//]: <> (%time)\n\nA\n\n[//]: # (same)\n\nB\n\n[//]: # (same)\n"
+    parser = _parser(tmp_path, markdown)
+    comment = parser._to_comment("same") # pylint: disable=W0212
+    assert parser.comments(markdown) == f"\n\nA\n\n{comment}\n\nB\n\n{comment}\n"
+
+@pytest.mark.parametrize("type_", ["odt", "doc", "tex,docx"])
+def test_unsupported_types_are_not_converted(tmp_path, capsys, type_):
+    path = tmp_path / "doc.md"
+    path.write_text("# Title\n\nText.\n")
+    assert convert(App([str(path), "-t", type_])) == 1
+    assert "is not supported yet" in capsys.readouterr().err
+    assert not (tmp_path / "doc.tex").exists()
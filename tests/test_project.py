@@ -0,0 +1,48 @@
+import os
+
+from mdtk import App
+from mdtk.project import IncludeGraph, convert_chapters
+
+
+def _project(tmp_path):
+    (tmp_path / "ch").mkdir()
+    (tmp_path / "ch" / "one.md").write_text("# First chapter\n\n## Setup\n\nText.\n")
+    main = tmp_path / "main.md"
+    main.write_text("# Book\n\n[//]: <> (%include ch/one.md)\n")
+    return main
+
+def _convert(main, *args, force=False):
+    app = App([str(main), "-o", str(main.with_suffix(".tex")), "-j", "1", *args])
+    return convert_chapters(app, IncludeGraph(app.input), force=force)
+
+
+def test_chapter_header_one_is_kept(tmp_path):
+    main = _project(tmp_path)
+    _convert(main, "--header-one-is-title", "ON")
+    fragment = (tmp_path / "ch" / "one.tex").read_text()
+    assert "\\section{First chapter}" in fragment
+    assert "\\subsection{Setup}" in fragment
+
+def test_chapters_converted_again_with_other_options(tmp_path):
+    main = _project(tmp_path)
+    target = tmp_path / "ch" / "one.tex"
+    assert _convert(main) == {target: True}
+    assert _convert(main) == {}
+    assert _convert(main, "-d", "book") == {target: True}
+    assert "\\part{First chapter}" in target.read_text()
+    assert _convert(main, "-d", "book", force=True) == {target: False}
+
+def test_touched_chapter_converted_once(tmp_path):
+    main = _project(tmp_path)
+    source = tmp_path / "ch" / "one.md"
+    target = tmp_path / "ch" / "one.tex"
+    _convert(main)
+    for path in (target, target.with_name("one.tex.stamp")):
+        earlier = path.stat().st_mtime_ns - 10**10
+        os.utime(path, ns=(earlier, earlier))
+    mtime = target.stat().st_mtime_ns
+    os.utime(source)
+    # Same content: the fragment is not rewritten, but is up to date
+    assert _convert(main) == {target: False}
+    assert target.stat().st_mtime_ns == mtime
+    assert _convert(main) == {}